@@ -0,0 +1,72 @@
+"""
+check that `import tools_qiu` (and the numpy code paths) stay cheap
+
+    python benchmarks/import_time.py [--budget 1.0]
+
+each import runs in a fresh interpreter, the best of a few runs is compared
+with the budget in seconds, and the heavy backends must not be loaded.
+exits with status 1 on a regression
+"""
+
+import argparse
+import subprocess
+import sys
+
+HEAVY_MODULES = ["linearmodels", "statsmodels", "sklearn", "matplotlib", "scipy"]
+
+IMPORTS = {
+    "tools_qiu": "import tools_qiu",
+    "calculate_hte": "from tools_qiu import calculate_hte",
+    "residual_pick": "from tools_qiu import residual_pick",
+}
+
+SCRIPT = """
+import sys, time
+start = time.perf_counter()
+{statement}
+seconds = time.perf_counter() - start
+print(seconds, *[m for m in {heavy!r} if m in sys.modules])
+"""
+
+
+def measure(statement, repeat):
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                SCRIPT.format(statement=statement, heavy=HEAVY_MODULES),
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.split()
+        runs.append((float(output[0]), output[1:]))
+    return min(runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--budget", type=float, default=1.0, help="seconds")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    failed = False
+    for name, statement in IMPORTS.items():
+        seconds, loaded = measure(statement, args.repeat)
+        ok = seconds <= args.budget and not loaded
+        failed |= not ok
+        print(
+            "{:<16} {:7.3f}s  {}{}".format(
+                name,
+                seconds,
+                "ok" if ok else "FAIL",
+                "  (loaded {})".format(", ".join(loaded)) if loaded else "",
+            )
+        )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+benchmarks of the hot paths at 10k, 1M and 10M rows
+
+    python benchmarks/run_benchmarks.py                      # compare with the baseline
+    python benchmarks/run_benchmarks.py --save-baseline      # store a new baseline
+    python benchmarks/run_benchmarks.py --sizes 10k,1M --only calculate_te,pick_top
+
+the data comes from the simulators with fixed seeds, so every run measures
+the same inputs. wall time is the best of --repeat runs, peak memory is the
+largest traced allocation (tracemalloc, measured in a separate run after a
+warm-up call, so lazy imports and tracing do not distort the numbers).
+a case regresses when its time or memory exceeds the baseline by more than
+--threshold; the exit status is 1 if any case regresses. baselines depend on
+the machine, keep one per box.
+everything runs offline
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np  # noqa: E402
+from tools_qiu.cherry_pick_tools.calculate_score import calculate_score  # noqa: E402
+from tools_qiu.cherry_pick_tools.residual_pick import residual_pick  # noqa: E402
+from tools_qiu.data_simulation_tools.simulate_iv import (  # noqa: E402
+    DEFAULT_DATA_GENERATION_PARAMETERS as IV_PARAMETERS,
+)
+from tools_qiu.data_simulation_tools.simulate_iv import simulate_iv  # noqa: E402
+from tools_qiu.data_simulation_tools.simulate_iv_base_rate_neglect import (  # noqa: E402
+    simulate_iv_base_rate_neglect,
+)
+from tools_qiu.data_simulation_tools.simulate_rct import (  # noqa: E402
+    DEFAULT_DATA_GENERATION_PARAMETERS as RCT_PARAMETERS,
+)
+from tools_qiu.data_simulation_tools.simulate_rct import simulate_rct  # noqa: E402
+from tools_qiu.hte_tools.calculate_hte import calculate_hte  # noqa: E402
+from tools_qiu.hte_tools.evaluate_hte import evaluate_hte  # noqa: E402
+from tools_qiu.hte_tools.pick_top import pick_top  # noqa: E402
+from tools_qiu.te_tools.calculate_te import calculate_te  # noqa: E402
+
+SIZES = {"10k": 10_000, "1M": 1_000_000, "10M": 10_000_000}
+BASELINE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "baseline.json"
+)
+
+
+def rct_data(n):
+    return simulate_rct(dict(RCT_PARAMETERS, sample_size=n))
+
+
+def iv_data(n):
+    df = simulate_iv(dict(IV_PARAMETERS, sample_size=n))
+    # a stand-in for a predicted effect, used as the ranking criterion
+    df["score"] = np.random.default_rng(0).standard_normal(n) + df["x1"]
+    return df
+
+
+def base_rate_types(n):
+    return [
+        {"size": n // 3, "first_stage": 2, "second_stage": 1 / 2, "scale": 1},
+        {"size": n // 3, "first_stage": 3, "second_stage": 1 / 3, "scale": 1},
+        {
+            "size": n - 2 * (n // 3),
+            "first_stage": 300,
+            "second_stage": 101 / 300,
+            "scale": 100,
+        },
+    ]
+
+
+# name: (data generator or None, function of (data, n), largest size or None)
+CASES = {
+    "simulate_rct": (None, rct_data, None),
+    "simulate_iv": (None, iv_data, None),
+    "simulate_iv_base_rate_neglect": (
+        None,
+        lambda n: simulate_iv_base_rate_neglect(
+            base_rate_types(n), random_seed=1, estimate=False
+        ),
+        None,
+    ),
+    "calculate_te[numpy iv]": (
+        iv_data,
+        lambda df, n: calculate_te(
+            df, "treatment", ["x1"], "x", "y", True, 0.95, engine="numpy"
+        ),
+        None,
+    ),
+    "calculate_te[linearmodels iv]": (
+        iv_data,
+        lambda df, n: calculate_te(df, "treatment", ["x1"], "x", "y", True, 0.95),
+        1_000_000,
+    ),
+    "calculate_te[numpy ols]": (
+        rct_data,
+        lambda df, n: calculate_te(
+            df, "treatment", ["x1", "x2"], None, "y", False, 0.95, engine="numpy"
+        ),
+        None,
+    ),
+    "calculate_hte[numpy 10 bins]": (
+        iv_data,
+        lambda df, n: calculate_hte(
+            df, "score", False, 10, "treatment", ["x1"], "x", "y", True, engine="numpy"
+        ),
+        None,
+    ),
+    "calculate_hte[linearmodels 10 bins]": (
+        iv_data,
+        lambda df, n: calculate_hte(
+            df, "score", False, 10, "treatment", ["x1"], "x", "y", True
+        ),
+        1_000_000,
+    ),
+    "evaluate_hte": (
+        iv_data,
+        lambda df, n: evaluate_hte(df, "score", 0.3, "y", "x", "treatment"),
+        None,
+    ),
+    "pick_top": (
+        iv_data,
+        lambda df, n: pick_top(df, "score", 10, subset=True),
+        None,
+    ),
+    "residual_pick": (
+        rct_data,
+        lambda df, n: residual_pick(
+            df, "treatment", ["x1", "x2"], "y", 10, full_output=False
+        ),
+        None,
+    ),
+    "calculate_score[numpy 100 rounds]": (
+        rct_data,
+        lambda df, n: calculate_score(
+            df.copy(),
+            "treatment",
+            ["x1", "x2"],
+            "y",
+            engine="numpy",
+            num_rounds=100,
+            random_seed=0,
+        ),
+        None,
+    ),
+}
+
+
+def measure(function, args, repeat):
+    """
+    best wall time of repeat runs and peak traced memory in MB
+    """
+    # a first call loads lazy imports, which should not count as memory
+    function(*args)
+    gc.collect()
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+
+    seconds = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        function(*args)
+        seconds.append(time.perf_counter() - start)
+    return {"seconds": min(seconds), "peak_mb": peak}
+
+
+def run(sizes, only, repeat):
+    results = {}
+    for size_name in sizes:
+        n = SIZES[size_name]
+        data_cache = {}
+        for name, (generate, function, max_rows) in CASES.items():
+            if only and not any(part in name for part in only):
+                continue
+            if max_rows is not None and n > max_rows:
+                continue
+            if generate is None:
+                args = (n,)
+            else:
+                if generate not in data_cache:
+                    data_cache[generate] = generate(n)
+                args = (data_cache[generate], n)
+            key = "{}@{}".format(name, size_name)
+            results[key] = measure(function, args, repeat)
+            print(
+                "{:<48} {:9.4f}s {:10.1f}MB".format(
+                    key, results[key]["seconds"], results[key]["peak_mb"]
+                ),
+                flush=True,
+            )
+        del data_cache
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    cases slower or larger than the baseline by more than threshold
+    """
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        for metric, slack in [("seconds", 0.005), ("peak_mb", 1.0)]:
+            # tiny absolute changes are timer and allocator noise
+            before, after = baseline[key][metric], result[metric]
+            ratio = after / max(before, 1e-9)
+            if ratio > 1 + threshold and after - before > slack:
+                regressions.append((key, metric, before, after, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--sizes", default="10k,1M,10M", help="comma separated, of 10k, 1M, 10M"
+    )
+    parser.add_argument(
+        "--only", default="", help="comma separated parts of case names"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--threshold", type=float, default=0.25, help="allowed relative increase"
+    )
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    sizes = args.sizes.split(",")
+    only = [part for part in args.only.split(",") if part]
+    results = run(sizes, only, args.repeat)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)["results"]
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(
+                {
+                    "machine": platform.platform(),
+                    "python": platform.python_version(),
+                    "results": baseline,
+                },
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+        print("saved the baseline to {}".format(args.baseline))
+        return
+
+    if not os.path.exists(args.baseline):
+        print("no baseline at {}, run with --save-baseline first".format(args.baseline))
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.threshold)
+    for key, metric, before, after, ratio in regressions:
+        print(
+            "REGRESSION {} {}: {:.4g} -> {:.4g} ({:+.0%})".format(
+                key, metric, before, after, ratio - 1
+            )
+        )
+    if not regressions:
+        print("no regressions above {:.0%}".format(args.threshold))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
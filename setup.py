@@ -25,4 +25,7 @@ setup(
         "linearmodels",
         "statsmodels",
     ],  # Add any dependencies your library requires
+    entry_points={
+        "console_scripts": ["tools-qiu-batch = tools_qiu.batch_runner:main"],
+    },
 )
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from tools_qiu.data_simulation_tools.simulate_iv import (
+    DEFAULT_DATA_GENERATION_PARAMETERS,
+    simulate_iv,
+)
+from tools_qiu.data_simulation_tools.simulate_rct import (
+    DEFAULT_DATA_GENERATION_PARAMETERS as RCT_PARAMETERS,
+    simulate_rct,
+)
+
+# samples shared by the test modules, tests that change them work on a copy
+
+
+@pytest.fixture(scope="module")
+def iv_df():
+    return simulate_iv(dict(DEFAULT_DATA_GENERATION_PARAMETERS, sample_size=5000))
+
+
+@pytest.fixture(scope="module")
+def rct_df():
+    return simulate_rct(dict(RCT_PARAMETERS, sample_size=20000))
+
+
+@pytest.fixture(scope="module")
+def hte_df():
+    # an iv sample with a noisy ranking score of the effect
+    df = simulate_iv(dict(DEFAULT_DATA_GENERATION_PARAMETERS, sample_size=2000))
+    rng = np.random.default_rng(5)
+    df["score"] = df["x1"] + rng.normal(size=len(df))
+    return df
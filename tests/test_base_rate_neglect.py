@@ -0,0 +1,34 @@
+import pandas as pd
+import pytest
+from tools_qiu.data_simulation_tools.simulate_iv_base_rate_neglect import (
+    base_rate_neglect_chunks,
+    simulate_iv_base_rate_neglect,
+)
+from tools_qiu.te_tools.calculate_te import calculate_te
+
+USER_TYPES = [
+    {"size": 3000, "first_stage": 2, "second_stage": 1 / 2, "scale": 1},
+    {"size": 2500, "first_stage": 3, "second_stage": 1 / 3, "scale": 1},
+]
+
+
+def test_chunked_estimates_are_those_of_the_chunks():
+    results = simulate_iv_base_rate_neglect(USER_TYPES, random_seed=0, chunk_size=700)
+    df = pd.concat(
+        base_rate_neglect_chunks(USER_TYPES, random_seed=0, chunk_size=700),
+        ignore_index=True,
+    )
+    assert results[0] is None
+    assert len(df) == 5500
+    args = ("treatment", ["x2"], "x", "y", True, 0.95, "numpy")
+    expected = {
+        "iv_effect_type_1": calculate_te(df[df["type"] == 1], *args)["te"],
+        "iv_effect_type_2": calculate_te(df[df["type"] == 2], *args)["te"],
+        "iv_effect_type_1_plus_2": calculate_te(df, *args)["te"],
+    }
+    assert results[1] == pytest.approx(expected, rel=1e-10)
+
+
+def test_chunk_size_needs_estimate():
+    with pytest.raises(ValueError, match="base_rate_neglect_chunks"):
+        simulate_iv_base_rate_neglect(USER_TYPES, estimate=False, chunk_size=700)
@@ -0,0 +1,105 @@
+import pandas as pd
+import pytest
+from tools_qiu.batch_runner import run_batch
+from tools_qiu.data_simulation_tools.simulate_iv import simulate_iv
+
+HTE_ARGS = {
+    "criterion": "x1",
+    "is_cat": False,
+    "n_bins": 3,
+    "t": "treatment",
+    "X_exo": None,
+    "X_end": "x",
+    "iv": True,
+    "engine": "numpy",
+}
+
+
+@pytest.fixture
+def data_path(tmp_path):
+    path = tmp_path / "users.pkl"
+    simulate_iv().to_pickle(path)
+    return str(path)
+
+
+def test_failing_outcome_does_not_fail_merged_members(data_path, tmp_path):
+    spec = {
+        "data": {"users": data_path},
+        "analyses": [
+            {
+                "name": name,
+                "function": "calculate_hte",
+                "data": "users",
+                "args": dict(HTE_ARGS, y=outcome),
+            }
+            for name, outcome in [("hte_y", "y"), ("hte_missing", "missing")]
+        ],
+    }
+    summary = run_batch(spec, output=str(tmp_path / "out"), file_format="csv")
+    status = summary.set_index("name")["status"]
+    assert status["hte_y"] == "ok"
+    assert status["hte_missing"].startswith("error")
+
+
+def test_plot_input_must_be_calculate_hte(data_path, tmp_path):
+    spec = {
+        "data": {"users": data_path},
+        "analyses": [
+            {
+                "name": "te",
+                "function": "calculate_te",
+                "data": "users",
+                "args": {
+                    "t": "treatment",
+                    "X_exo": None,
+                    "X_end": "x",
+                    "y": "y",
+                    "iv": True,
+                    "conf_level": 0.95,
+                },
+            },
+            {"name": "te_plot", "function": "plot_hte", "input": "te"},
+        ],
+    }
+    with pytest.raises(ValueError, match="calculate_hte"):
+        run_batch(spec, output=str(tmp_path / "out"))
+
+
+def test_merged_result_equals_the_analysis_alone(data_path, tmp_path):
+    users = simulate_iv()
+    users["y2"] = users["y"] + users["x1"]
+    users.loc[::3, "y2"] = None
+    users.to_pickle(data_path)
+
+    def analysis(name, outcome):
+        return {
+            "name": name,
+            "function": "calculate_hte",
+            "data": "users",
+            "args": dict(HTE_ARGS, y=outcome),
+        }
+
+    lift = {
+        "name": "lift",
+        "function": "evaluate_hte",
+        "data": "users",
+        "args": {"criterion": "x1", "p_x": 30, "y": "y", "x": "x", "t": "treatment"},
+    }
+    merged = {
+        "data": {"users": data_path},
+        "analyses": [analysis("hte_y", "y"), analysis("hte_y2", "y2"), lift],
+    }
+    alone = {"data": {"users": data_path}, "analyses": [analysis("hte_y", "y")]}
+    summary = run_batch(merged, output=str(tmp_path / "merged"), file_format="csv")
+    run_batch(alone, output=str(tmp_path / "alone"), file_format="csv")
+
+    functions = summary.set_index("name")["function"]
+    assert functions["hte_y"] == "calculate_hte"
+    assert functions["lift"] == "evaluate_hte"
+    assert summary.set_index("name")["shared_by"]["hte_y"] == 2
+    pd.testing.assert_frame_equal(
+        pd.read_csv(tmp_path / "merged" / "hte_y.csv"),
+        pd.read_csv(tmp_path / "alone" / "hte_y.csv"),
+        check_exact=False,
+        rtol=1e-10,
+    )
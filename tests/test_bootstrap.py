@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from tools_qiu.hte_tools.bootstrap import bootstrap_hte
+from tools_qiu.hte_tools.calculate_hte import calculate_hte
+
+
+@pytest.fixture(scope="module")
+def iv_df(iv_df):
+    df = iv_df.copy()
+    df["group"] = np.where(np.arange(len(df)) % 2 == 0, "all", "other")
+    return df
+
+
+def test_category_named_all_keeps_its_interval(iv_df):
+    results = calculate_hte(
+        iv_df,
+        "group",
+        True,
+        None,
+        "treatment",
+        ["x1"],
+        "x",
+        "y",
+        True,
+        engine="numpy",
+        n_boot=200,
+        random_seed=0,
+    )
+    category, overall = results.iloc[[0, -1]].itertuples()
+    assert category.subset_name == overall.subset_name == "all"
+    assert category.data_size == len(iv_df) // 2
+    # the overall interval is narrower than the one of half the rows
+    assert overall.te_boot_high - overall.te_boot_low < (
+        category.te_boot_high - category.te_boot_low
+    )
+    for row in [category, overall]:
+        assert row.te_boot_low < row.te < row.te_boot_high
+
+
+def test_batches_do_not_change_the_intervals(iv_df):
+    df = iv_df.copy()
+    df.loc[::9, "y"] = np.nan
+    args = (df, "treatment", ["x1"], "x", "y", True, 50, 0.9)
+    expected = bootstrap_hte(*args, random_seed=0)
+    # a small max_elements solves the replicates one at a time
+    result = bootstrap_hte(*args, random_seed=0, max_elements=1)
+    assert np.isfinite(expected).all()
+    assert result == pytest.approx(expected, rel=1e-10)
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+from tools_qiu.hte_tools.calculate_hte import calculate_hte, subset_codes
+from tools_qiu.te_tools.calculate_te import calculate_te
+
+
+@pytest.mark.parametrize("is_cat", [False, True])
+def test_numpy_engine_matches_linearmodels_with_missing_values(iv_df, is_cat):
+    df = iv_df.copy()
+    df["group"] = np.where(df["x1"] > 0.5, "high", "low")
+    rng = np.random.default_rng(2)
+    for col in ["x1", "x", "y"]:
+        df.loc[rng.choice(len(df), 100), col] = np.nan
+    criterion = "group" if is_cat else "x1"
+    args = (df, criterion, is_cat, 4, "treatment", ["x1"], "x", "y", True)
+    expected = calculate_hte(*args)
+    result = calculate_hte(*args, engine="numpy")
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False, rtol=1e-8)
+
+
+def test_quantile_bins_are_half_open_and_partition_the_rows():
+    # many ties on the quantiles
+    df = pd.DataFrame({"score": np.repeat(np.arange(10.0), 7)})
+    df.loc[::9, "score"] = np.nan
+    codes, names, _ = subset_codes(df, "score", False, 4)
+    quantiles = df["score"].quantile(np.linspace(0, 1, 5)).to_numpy()
+    values = df["score"].to_numpy()
+    assert names == ["25%", "50%", "75%", "100%"]
+    assert np.array_equal(codes < 0, np.isnan(values))
+    for value, code in zip(values, codes):
+        if code >= 0:
+            assert quantiles[code] <= value
+            assert value < quantiles[code + 1] or value == quantiles[-1]
+
+
+def test_cross_bins_are_the_subsets_of_both_criteria(iv_df):
+    df = iv_df.copy()
+    df["group"] = np.random.default_rng(3).choice(["a", "b"], len(df))
+    args = ("treatment", ["x1"], "x", "y", True)
+    results = calculate_hte(
+        df, ["x1", "group"], [False, True], [3, None], *args, engine="numpy"
+    )
+    # x1 has no ties, so the closed side of the bins does not matter
+    bins = pd.qcut(df["x1"], 3, labels=["33%", "67%", "100%"])
+    assert len(results) == 3 * 2 + 1
+    assert results["data_size"].iloc[:-1].sum() == len(df)
+    for row in results.iloc[:-1].itertuples():
+        x1_bin, group = row.subset_name.split(" & ")
+        subset = df[(bins == x1_bin) & (df["group"] == group)]
+        expected = calculate_te(subset, *args, 0.95, "numpy")
+        assert row.data_size == expected["data_size"]
+        assert row.te == pytest.approx(expected["te"], rel=1e-10)
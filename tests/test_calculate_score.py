@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from tools_qiu.cherry_pick_tools.calculate_score import calculate_score
+
+
+def numpy_score(df, **kwargs):
+    df = df.copy()
+    rounds = calculate_score(
+        df, "treatment", ["x1", "x2"], "y", engine="numpy", random_seed=0, **kwargs
+    )
+    return df["score"].to_numpy(), rounds
+
+
+def test_early_stopping_triggers(rct_df):
+    full_score, full_rounds = numpy_score(rct_df)
+    score, rounds = numpy_score(rct_df, tol=0.1)
+    assert full_rounds == 500
+    assert rounds < 500
+    # rescaled to num_rounds, so comparable with the full run
+    assert np.corrcoef(score, full_score)[0, 1] > 0.6
+    assert 0.5 < np.std(score) / np.std(full_score) < 2
+
+
+def test_tol_none_runs_all_rounds(rct_df):
+    _, rounds = numpy_score(rct_df, tol=None)
+    assert rounds == 500
+
+
+def test_sklearn_engine_rejects_numpy_options(rct_df):
+    with pytest.raises(ValueError, match="n_jobs"):
+        calculate_score(rct_df.copy(), "treatment", ["x1", "x2"], "y", n_jobs=4)
+
+
+@pytest.mark.parametrize("replacement", [False, True])
+def test_numpy_engine_matches_sklearn_under_the_global_seed(rct_df, replacement):
+    scores = []
+    for engine in ["sklearn", "numpy"]:
+        df = rct_df.copy()
+        np.random.seed(3)
+        calculate_score(
+            df,
+            "treatment",
+            ["x1", "x2"],
+            "y",
+            num_rounds=20,
+            replacement=replacement,
+            engine=engine,
+        )
+        scores.append(df["score"].to_numpy())
+    # same draws, the scores differ only by the rounding of the summed rounds
+    np.testing.assert_allclose(scores[1], scores[0], rtol=0, atol=1e-14)
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from tools_qiu.hte_tools.calculate_hte import calculate_hte
+from tools_qiu.te_tools.calculate_te import calculate_te
+from tools_qiu.te_tools.calculate_te_chunked import calculate_te_chunked
+
+
+def assert_same_result(result, expected):
+    assert set(result) == set(expected)
+    for key, value in expected.items():
+        if value is None or isinstance(value, (str, bool)):
+            assert result[key] == value, key
+        else:
+            assert result[key] == pytest.approx(value, rel=1e-8), key
+
+
+@pytest.mark.parametrize("iv", [True, False])
+def test_numpy_engine_matches_linearmodels_with_missing_values(iv_df, iv):
+    df = iv_df.copy()
+    rng = np.random.default_rng(0)
+    for col in ["x1", "x", "y"]:
+        df.loc[rng.choice(len(df), 100), col] = np.nan
+    df.loc[::10, "x1"] = np.nan
+    args = (df, "treatment", ["x1"], "x" if iv else None, "y", iv, 0.95)
+    assert_same_result(calculate_te(*args, "numpy"), calculate_te(*args))
+
+
+def test_numpy_engine_rejects_non_binary_treatment(iv_df):
+    df = iv_df.assign(treatment=iv_df["treatment"] + 1)
+    with pytest.raises(ValueError, match="0/1 treatment"):
+        calculate_te(df, "treatment", None, "x", "y", True, 0.95, engine="numpy")
+
+
+def test_chunked_drops_incomplete_rows(iv_df, tmp_path):
+    df = iv_df.copy()
+    df.loc[::7, "y"] = np.nan
+    df.loc[::11, "x1"] = np.nan
+    path = tmp_path / "data.csv"
+    df.to_csv(path, index=False)
+    expected = calculate_te(df, "treatment", ["x1"], "x", "y", True, 0.95, "numpy")
+    result = calculate_te_chunked(
+        path, "treatment", ["x1"], "x", "y", True, 0.95, chunk_size=700
+    )
+    assert_same_result(result, expected)
+
+
+def test_chunked_rejects_file_without_rows(iv_df, tmp_path):
+    path = tmp_path / "empty.csv"
+    iv_df.iloc[:0].to_csv(path, index=False)
+    with pytest.raises(ValueError, match="no complete rows"):
+        calculate_te_chunked(path, "treatment", ["x1"], "x", "y", True, 0.95)
+
+
+def test_float32_is_close_to_float64(iv_df):
+    args = (iv_df, "treatment", ["x1"], "x", "y", True, 0.95, "numpy")
+    expected = calculate_te(*args)
+    result = calculate_te(*args, float32=True)
+    assert result["te"] == pytest.approx(expected["te"], rel=1e-4)
+    with pytest.raises(ValueError, match="engine='numpy'"):
+        calculate_te(iv_df, "treatment", ["x1"], "x", "y", True, 0.95, float32=True)
+
+
+def test_outcomes_keep_their_own_complete_rows(iv_df):
+    df = iv_df.assign(y2=iv_df["y"] * 2 + iv_df["x1"])
+    df.loc[::4, "y2"] = np.nan
+    args = ("treatment", ["x1"], "x")
+    together = calculate_te(df, *args, ["y", "y2"], True, 0.95, "numpy")
+    for j, outcome in enumerate(["y", "y2"]):
+        alone = calculate_te(df, *args, outcome, True, 0.95, "numpy")
+        for key in ["data_size", "te", "std"]:
+            assert together.loc[j, key] == pytest.approx(alone[key], rel=1e-10)
+
+    hte_together = calculate_hte(
+        df, "x1", False, 3, *args, ["y", "y2"], True, engine="numpy"
+    )
+    hte_alone = calculate_hte(df, "x1", False, 3, *args, "y", True, engine="numpy")
+    rows = hte_together[hte_together["y"] == "y"].reset_index(drop=True)
+    assert rows["te"].values == pytest.approx(hte_alone["te"].values, rel=1e-10)
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+from tools_qiu.cherry_pick_tools.residual_pick import residual_pick
+from tools_qiu.hte_tools.calculate_hte import calculate_hte
+from tools_qiu.hte_tools.evaluate_hte import evaluate_hte
+from tools_qiu.te_tools.calculate_te import calculate_te
+
+
+def convert(df, kind):
+    if kind == "polars":
+        pl = pytest.importorskip("polars")
+        return pl.from_pandas(df)
+    pa = pytest.importorskip("pyarrow")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if kind == "arrow_chunks":
+        # three record batches, so the columns have several chunks
+        table = pa.Table.from_batches(table.to_batches(max_chunksize=700))
+    return table
+
+
+@pytest.fixture(scope="module")
+def frame(hte_df):
+    df = hte_df.copy()
+    df["group"] = np.where(df["x1"] > 0.5, "high", "low")
+    df.loc[::50, "y"] = np.nan
+    return df
+
+
+@pytest.mark.parametrize("kind", ["arrow", "arrow_chunks", "polars"])
+def test_arrow_and_polars_match_pandas(frame, kind):
+    data = convert(frame, kind)
+    args = ("treatment", ["x1"], "x", "y", True, 0.95)
+    for engine in ["linearmodels", "numpy"]:
+        assert calculate_te(data, *args, engine) == calculate_te(frame, *args, engine)
+
+    hte_args = ("group", True, None, "treatment", ["x1"], "x", "y", True)
+    pd.testing.assert_frame_equal(
+        calculate_hte(data, *hte_args, engine="numpy"),
+        calculate_hte(frame, *hte_args, engine="numpy"),
+    )
+    evaluate_args = ("score", 30, "y", "x", "treatment")
+    assert evaluate_hte(data, *evaluate_args) == evaluate_hte(frame, *evaluate_args)
+    pick_args = ("treatment", ["x1"], "x", 20)
+    pd.testing.assert_frame_equal(
+        residual_pick(data, *pick_args, full_output=False),
+        residual_pick(frame, *pick_args, full_output=False),
+    )
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from tools_qiu.hte_tools.evaluate_hte import evaluate_hte
+from tools_qiu.hte_tools.evaluate_hte_batch import evaluate_hte_batch
+
+
+def linear_scan(df, criterion, p_x, y, x, t, approx_level, start_point, search_step):
+    # the evaluate_hte cutoff search before the cumulative-sum lift curve
+    df = df.sort_values(by=criterion, ascending=False).reset_index(drop=True)
+
+    def calculate_lift(index_cutoff, target):
+        df_temp = df.loc[df.index <= index_cutoff]
+        n_c = df_temp.groupby(t)[t].count().sort_index(ascending=True)[0]
+        target_avg_c, target_avg_t = (
+            df_temp.groupby(t)[target].mean().sort_index(ascending=True)
+        )
+        return (target_avg_t - target_avg_c) * n_c
+
+    total_lift_x_all = calculate_lift(df.shape[0], x)
+    total_lift_y_all = calculate_lift(df.shape[0], y)
+    for i in range(start_point, df.shape[0], search_step):
+        if abs(calculate_lift(i, x) / total_lift_x_all - p_x / 100) <= approx_level:
+            break
+    return {
+        "p_y": 100 * (calculate_lift(i, y) / total_lift_y_all),
+        "p_users": 100 * i / df.shape[0],
+        "criterion_cutoff": df.loc[df.index == i, criterion].values[0],
+    }
+
+
+@pytest.mark.parametrize("missing", [False, True])
+def test_matches_the_linear_scan(hte_df, missing):
+    df = hte_df.copy()
+    if missing:
+        df.loc[::50, "y"] = np.nan
+        df.loc[7::60, "x"] = np.nan
+    options = {"approx_level": 0.01, "start_point": 20, "search_step": 3}
+    expected = linear_scan(df, "score", 30, "y", "x", "treatment", **options)
+    result = evaluate_hte(df, "score", 30, "y", "x", "treatment", **options)
+    assert np.isfinite(result["p_y"])
+    for key, value in expected.items():
+        assert result[key] == pytest.approx(value, rel=1e-9)
+
+
+def test_batch_matches_the_linear_scan(hte_df):
+    options = {"approx_level": 0.01, "start_point": 20, "search_step": 3}
+    result = evaluate_hte_batch(
+        hte_df, ["score", "x1"], [20, 30, 50], "y", "x", "treatment", **options
+    )
+    assert len(result) == 6
+    for row in result.itertuples():
+        expected = linear_scan(
+            hte_df, row.criterion_name, row.p_x, "y", "x", "treatment", **options
+        )
+        for key, value in expected.items():
+            assert getattr(row, key) == pytest.approx(value, rel=1e-9)
+
+
+def test_bootstrap_skips_missing_values(hte_df):
+    df = hte_df.copy()
+    df.loc[::50, "y"] = np.nan
+    result = evaluate_hte(
+        df, "score", 30, "y", "x", "treatment", n_boot=50, random_seed=0
+    )
+    assert result["p_y_low"] < result["p_y"] < result["p_y_high"]
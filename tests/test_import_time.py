@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ["linearmodels", "statsmodels", "sklearn", "matplotlib", "scipy"]
+
+SCRIPT = """
+import sys, time
+start = time.perf_counter()
+{statement}
+print(time.perf_counter() - start, *[m for m in {heavy!r} if m in sys.modules])
+"""
+
+
+def timed_import(statement):
+    # a fresh interpreter, the test session has already loaded everything
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    path = os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")]))
+    env = dict(os.environ, PYTHONPATH=path)
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT.format(statement=statement, heavy=HEAVY_MODULES)],
+        check=True,
+        capture_output=True,
+        text=True,
+        env=env,
+    ).stdout.split()
+    return float(output[0]), output[1:]
+
+
+@pytest.mark.parametrize(
+    "statement, budget",
+    [
+        ("import tools_qiu", 0.5),
+        ("from tools_qiu import calculate_hte", 2.0),
+        ("from tools_qiu import residual_pick", 2.0),
+    ],
+)
+def test_import_is_cheap(statement, budget):
+    seconds, loaded = timed_import(statement)
+    assert loaded == []
+    assert seconds < budget
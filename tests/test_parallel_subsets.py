@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+import pytest
+from tools_qiu.hte_tools.parallel_subsets import fit_subsets
+from tools_qiu.te_tools.calculate_te import calculate_te
+
+FIT_KWARGS = {
+    "t": "treatment",
+    "X_exo": None,
+    "X_end": "x",
+    "y": "y",
+    "iv": True,
+    "conf_level": 0.95,
+}
+COLUMNS = ["treatment", "x", "y"]
+
+
+@pytest.fixture(scope="module")
+def iv_df(iv_df):
+    df = iv_df.copy()
+    df["label"] = np.where(df["x1"] > 1, "high", "low")
+    return df
+
+
+def shared_segments():
+    if not os.path.isdir("/dev/shm"):
+        pytest.skip("no /dev/shm to inspect")
+    return set(os.listdir("/dev/shm"))
+
+
+def test_matches_serial_fits_with_object_columns(iv_df):
+    subsets = [np.arange(0, 1000), np.arange(1000, len(iv_df)), None]
+    results = fit_subsets(
+        iv_df, COLUMNS + ["label"], subsets, FIT_KWARGS, n_jobs=2, executor="process"
+    )
+    expected = [
+        calculate_te(iv_df.iloc[:1000], **FIT_KWARGS),
+        calculate_te(iv_df.iloc[1000:], **FIT_KWARGS),
+        calculate_te(iv_df, **FIT_KWARGS),
+    ]
+    for result, reference in zip(results, expected):
+        assert result["te"] == pytest.approx(reference["te"], rel=1e-10)
+        assert result["data_size"] == reference["data_size"]
+
+
+def test_segments_are_unlinked_when_a_worker_raises(iv_df):
+    before = shared_segments()
+    with pytest.raises(ValueError, match="engine"):
+        fit_subsets(
+            iv_df,
+            COLUMNS,
+            [np.arange(100), None],
+            dict(FIT_KWARGS, engine="unknown"),
+            n_jobs=2,
+            executor="process",
+        )
+    assert shared_segments() <= before
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+from tools_qiu.hte_tools.pick_top import pick_top
+
+
+def apply_labels(df, criterion, top_p):
+    # the pick_top labels before the vectorized version
+    threshold = df[criterion].quantile(1 - top_p / 100)
+    return df[criterion].apply(
+        lambda x: "top {}%".format(top_p) if x > threshold else "rest"
+    )
+
+
+def test_labels_are_unchanged(hte_df):
+    df = hte_df[["score"]].copy()
+    df.loc[::40, "score"] = np.nan
+    # ties around the threshold
+    df.loc[1::40, "score"] = df["score"].quantile(0.7)
+    for top_p in [5, 30, 50]:
+        pick_top(df, "score", top_p)
+        assert list(df["top_score"].astype(str)) == list(
+            apply_labels(df, "score", top_p)
+        )
+        pd.testing.assert_frame_equal(
+            pick_top(df, "score", top_p, subset=True),
+            df.loc[df["score"] > df["score"].quantile(1 - top_p / 100)],
+        )
+
+
+def test_shares_give_the_single_share_labels(hte_df):
+    df = hte_df[["score"]].copy()
+    pick_top(df, "score", [10, 30])
+    for top_p in [10, 30]:
+        expected = apply_labels(df, "score", top_p)
+        assert list(df["top_score_{}".format(top_p)].astype(str)) == list(expected)
@@ -0,0 +1,18 @@
+import os
+
+import pytest
+from tools_qiu.data_simulation_tools.simulate_rct import simulate_rct
+from tools_qiu.hte_tools.calculate_hte import calculate_hte
+from tools_qiu.hte_tools.plot_hte import plot_hte_batch
+
+pytest.importorskip("matplotlib")
+
+
+def test_sanitized_names_do_not_overwrite(tmp_path):
+    result = calculate_hte(
+        simulate_rct(), "x1", False, 3, "treatment", ["x1"], None, "y", False
+    )
+    # both criteria sanitize to a_b
+    paths = plot_hte_batch({"a b": result, "a/b": result}, tmp_path, layout="files")
+    assert len(set(paths)) == 2
+    assert all(os.path.exists(path) for path in paths)
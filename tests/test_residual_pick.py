@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LinearRegression
+from tools_qiu.cherry_pick_tools.residual_pick import residual_pick
+
+
+def row_wise_pick(df, t, X_exo, y, pick_share, include_t=True):
+    # residual_pick before the vectorized labels
+    df = df.copy()
+    if X_exo is None:
+        Y = df[y]
+        if include_t:
+            X = df[[t]]
+            model = LinearRegression().fit(X, Y)
+            res = Y - model.predict(X)
+        else:
+            res = Y - Y.mean()
+    else:
+        if include_t:
+            X = df[[t] + X_exo]
+        else:
+            X = df[X_exo]
+        Y = df[y]
+        model = LinearRegression().fit(X, Y)
+        res = Y - model.predict(X)
+    df = df.assign(residual=res)
+
+    threshold_0 = df.loc[df[t] == 0, "residual"].quantile(pick_share / 100)
+    threshold_1 = df.loc[df[t] == 1, "residual"].quantile(1 - pick_share / 100)
+
+    df["residual_pick"] = 0
+    df["residual_pick"] = df.apply(
+        lambda row: (
+            1
+            if (row[t] == 1 and row["residual"] >= threshold_1)
+            or (row[t] == 0 and row["residual"] <= threshold_0)
+            else 0
+        ),
+        axis=1,
+    )
+    return df
+
+
+@pytest.mark.parametrize("X_exo", [None, ["x1", "x2"]])
+@pytest.mark.parametrize("include_t", [True, False])
+def test_matches_the_row_wise_pick(rct_df, X_exo, include_t):
+    df = rct_df.iloc[:3000]
+    for share in [10, 35]:
+        expected = row_wise_pick(df, "treatment", X_exo, "y", share, include_t)
+        result = residual_pick(df, "treatment", X_exo, "y", share, include_t)
+        pd.testing.assert_frame_equal(result, expected)
+
+
+def test_shares_give_the_single_share_columns(rct_df):
+    df = rct_df.iloc[:3000]
+    result = residual_pick(df, "treatment", ["x1"], "y", [10, 35], full_output=False)
+    for share in [10, 35]:
+        expected = residual_pick(df, "treatment", ["x1"], "y", share)
+        assert np.array_equal(
+            result["residual_pick_{}".format(share)], expected["residual_pick"]
+        )
@@ -0,0 +1,47 @@
+import os
+
+import numpy as np
+import pandas as pd
+from tools_qiu.data_simulation_tools.simulate_rct import simulate_rct
+from tools_qiu.hte_tools.calculate_hte import calculate_hte
+from tools_qiu.te_tools.result_cache import ResultCache
+
+
+def _frame(seed):
+    return pd.DataFrame({"a": np.random.default_rng(seed).normal(size=1000)})
+
+
+def test_memory_tier_is_bounded_by_bytes():
+    cache = ResultCache(max_bytes=20_000)
+    for seed in range(5):
+        df = _frame(seed)
+        cache.get_or_compute(df, ["a"], ("spec",), lambda: df.copy())
+    # each result is about 8kB, so only the two most recent fit
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["bytes"] <= 20_000
+
+
+def test_unreadable_file_is_a_miss(tmp_path):
+    cache = ResultCache(directory=tmp_path)
+    df = _frame(0)
+    cache.get_or_compute(df, ["a"], ("spec",), lambda: {"te": 1.0})
+    for entry in os.scandir(tmp_path):
+        with open(entry.path, "wb") as f:
+            # a pickle of a class that no longer exists
+            f.write(b"cno_such_module\nResult\n.")
+
+    fresh = ResultCache(directory=tmp_path)
+    assert fresh.get_or_compute(df, ["a"], ("spec",), lambda: {"te": 2.0}) == {
+        "te": 2.0
+    }
+    assert fresh.stats()["misses"] == 1
+
+
+def test_unseeded_bootstrap_is_not_cached():
+    df = simulate_rct()
+    cache = ResultCache()
+    args = (df, "x1", False, 2, "treatment", ["x1"], None, "y", False)
+    calculate_hte(*args, engine="numpy", cache=cache, n_boot=20)
+    assert cache.stats()["entries"] == 0
+    calculate_hte(*args, engine="numpy", cache=cache, n_boot=20, random_seed=1)
+    assert cache.stats()["entries"] == 1
@@ -0,0 +1,30 @@
+import pytest
+from tools_qiu.montecarlo_tools.run_montecarlo import run_montecarlo
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"simulator": "rct"},
+        {"simulator": "iv"},
+        {"simulator": "iv", "X_end": "x", "iv": True},
+    ],
+)
+def test_coverage_is_near_nominal_with_defaults(kwargs):
+    summary, reps_df = run_montecarlo(n_reps=200, **kwargs)
+    assert abs(summary["bias"]) < 0.1 * abs(summary["true_te"])
+    assert abs(summary["coverage"] - 0.95) < 0.05
+    assert len(reps_df) == 200
+
+
+def test_linearmodels_engine_without_covariates():
+    summary, _ = run_montecarlo(n_reps=20, engine="linearmodels")
+    numpy_summary, _ = run_montecarlo(n_reps=20)
+    assert summary["mean_te"] == pytest.approx(numpy_summary["mean_te"], rel=1e-8)
+
+
+def test_timings_are_per_batch():
+    summary, reps_df = run_montecarlo(n_reps=30, batch_size=10)
+    assert reps_df.groupby("batch")["batch_seconds"].nunique().eq(1).all()
+    batch_seconds = reps_df.groupby("batch")["batch_seconds"].first()
+    assert summary["seconds_per_rep"] == pytest.approx(batch_seconds.sum() / 30)
@@ -0,0 +1,22 @@
+import pandas as pd
+import pytest
+from tools_qiu.data_simulation_tools.simulate_chunks import (
+    RCT_PARAMETERS,
+    simulate_chunks,
+)
+
+
+@pytest.mark.parametrize("chunk_size", [7, 1000, 4096, 5000])
+def test_chunk_size_does_not_change_the_rows(chunk_size):
+    parameters = dict(RCT_PARAMETERS, sample_size=10_003)
+    expected = pd.concat(
+        simulate_chunks("rct", parameters, chunk_size=10_003, block_size=4096)
+    )
+    chunks = list(
+        simulate_chunks("rct", parameters, chunk_size=chunk_size, block_size=4096)
+    )
+    assert all(len(chunk) == chunk_size for chunk in chunks[:-1])
+    result = pd.concat(chunks)
+    pd.testing.assert_frame_equal(
+        result.reset_index(drop=True), expected.reset_index(drop=True)
+    )
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from tools_qiu.hte_tools.calculate_hte import calculate_hte
+from tools_qiu.te_tools.te_accumulator import TEAccumulator
+
+SPEC = {"t": "treatment", "X_exo": ["x1"], "X_end": "x", "y": "y", "iv": True}
+
+
+@pytest.fixture(scope="module")
+def iv_df(iv_df):
+    df = iv_df.copy()
+    rng = np.random.default_rng(1)
+    df["group"] = rng.choice(["a", "b", "c"], len(df))
+    df.loc[rng.choice(len(df), 300), "group"] = np.nan
+    df.loc[rng.choice(len(df), 100), "y"] = np.nan
+    return df
+
+
+def test_chunks_match_calculate_hte(iv_df):
+    acc = TEAccumulator(by="group", **SPEC)
+    # an empty first chunk leaves the state untouched
+    acc.update(iv_df.iloc[:0])
+    for start in range(0, len(iv_df), 1000):
+        acc.update(iv_df.iloc[start : start + 1000])
+    result = acc.hte_result().set_index("subset_name")
+
+    expected = calculate_hte(
+        iv_df, "group", True, None, engine="numpy", **SPEC
+    ).set_index("subset_name")
+    assert sorted(result.index) == sorted(expected.index)
+    for key in ["data_size", "y_c", "y_t", "end_c", "end_t", "te", "std"]:
+        assert result[key].values == pytest.approx(
+            expected.loc[result.index, key].values, rel=1e-8
+        )
+
+
+def test_empty_accumulator_raises(iv_df):
+    acc = TEAccumulator(**SPEC).update(iv_df.iloc[:0])
+    with pytest.raises(ValueError, match="no complete rows"):
+        acc.result()
+    with pytest.raises(ValueError, match="no complete rows"):
+        TEAccumulator(by="group", **SPEC).hte_result()
+
+
+def test_list_of_outcomes_is_rejected():
+    with pytest.raises(ValueError, match="single outcome"):
+        TEAccumulator(**dict(SPEC, y=["y", "x1"]))
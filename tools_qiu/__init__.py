@@ -0,0 +1,41 @@
+import importlib
+
+# the main functions, loaded on first use (import tools_qiu stays cheap,
+# heavy backends such as linearmodels or sklearn load only when needed)
+_API = {
+    "calculate_te": "te_tools.calculate_te",
+    "calculate_te_chunked": "te_tools.calculate_te_chunked",
+    "TEAccumulator": "te_tools.te_accumulator",
+    "ResultCache": "te_tools.result_cache",
+    "profile": "profiling",
+    "calculate_hte": "hte_tools.calculate_hte",
+    "evaluate_hte": "hte_tools.evaluate_hte",
+    "evaluate_hte_batch": "hte_tools.evaluate_hte_batch",
+    "pick_top": "hte_tools.pick_top",
+    "plot_hte": "hte_tools.plot_hte",
+    "plot_hte_batch": "hte_tools.plot_hte",
+    "calculate_score": "cherry_pick_tools.calculate_score",
+    "residual_pick": "cherry_pick_tools.residual_pick",
+    "simulate_rct": "data_simulation_tools.simulate_rct",
+    "simulate_iv": "data_simulation_tools.simulate_iv",
+    "simulate_iv_base_rate_neglect": "data_simulation_tools.simulate_iv_base_rate_neglect",
+    "base_rate_neglect_chunks": "data_simulation_tools.simulate_iv_base_rate_neglect",
+    "simulate_chunks": "data_simulation_tools.simulate_chunks",
+    "write_simulation": "data_simulation_tools.simulate_chunks",
+    "run_montecarlo": "montecarlo_tools.run_montecarlo",
+    "run_batch": "batch_runner",
+}
+
+__all__ = list(_API)
+
+
+def __getattr__(name):
+    if name not in _API:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module("." + _API[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
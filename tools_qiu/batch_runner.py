@@ -0,0 +1,412 @@
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pandas as pd
+
+# run many analyses over a few data files from one spec file
+# (console script tools-qiu-batch).
+# every data file is read once, and calls sharing work are merged:
+# calculate_hte specs that differ only in y become one multi-outcome call
+# (one binning, first stage and full-sample fit), evaluate_hte specs on the
+# same data and metrics become one evaluate_hte_batch call (one sort per
+# criterion, one total lift), identical specs run once.
+# the merged calls run in parallel, plots are drawn from their results
+
+FUNCTIONS = {
+    "calculate_te": "te_tools.calculate_te",
+    "calculate_hte": "hte_tools.calculate_hte",
+    "evaluate_hte": "hte_tools.evaluate_hte",
+    "evaluate_hte_batch": "hte_tools.evaluate_hte_batch",
+    "residual_pick": "cherry_pick_tools.residual_pick",
+}
+PLOT_OPTIONS = ("show_size", "percent", "note", "dpi", "fig_size")
+
+# data of the workers, filled before the pool starts (inherited with fork)
+_frames = {}
+
+
+def run_batch(spec, n_jobs=1, executor="process", output=None, file_format=None):
+    """
+    run the analyses of a spec and write one result file per analysis
+
+    Args:
+      spec: a dictionary or the path of a json file like
+        {
+          "data": {"users": "users.parquet"},
+          "output": "results",
+          "format": "parquet",
+          "analyses": [
+            {"name": "hte_x1", "function": "calculate_hte", "data": "users",
+             "args": {"criterion": "x1", "is_cat": false, "n_bins": 10,
+                      "t": "treatment", "X_exo": null, "X_end": "x",
+                      "y": "y", "iv": true, "engine": "numpy"}},
+            {"name": "lift_x1", "function": "evaluate_hte", "data": "users",
+             "args": {"criterion": "x1", "p_x": 30, "y": "y", "x": "x",
+                      "t": "treatment"}},
+            {"name": "hte_x1_plot", "function": "plot_hte", "input": "hte_x1",
+             "args": {"percent": true}}
+          ]
+        }
+        functions are calculate_te, calculate_hte, evaluate_hte,
+        residual_pick (with the arguments of the tool except df)
+        and plot_hte (with the options of plot_hte_batch, drawing the
+        result of the analysis named in input).
+        data files are parquet, csv, feather or pickle,
+        relative paths are relative to the spec file
+      n_jobs: number of workers (-1 uses all cores)
+      executor: "process" or "thread"
+      output: output folder (overrides the spec)
+      file_format: "parquet" or "csv" (overrides the spec)
+
+    Returns:
+      a dataframe with the name, function, status, seconds and path
+      of every analysis (also written to _summary.csv in the output folder)
+    """
+    base_dir = "."
+    if not isinstance(spec, dict):
+        base_dir = os.path.dirname(os.path.abspath(spec))
+        with open(spec) as f:
+            spec = json.load(f)
+    analyses = spec["analyses"]
+    output = os.path.join(base_dir, output or spec.get("output", "results"))
+    file_format = file_format or spec.get("format", "parquet")
+    if file_format not in ("parquet", "csv"):
+        raise ValueError("format must be 'parquet' or 'csv'")
+    check_spec(spec)
+    os.makedirs(output, exist_ok=True)
+
+    # every file once, only if an analysis uses it
+    used = {analysis["data"] for analysis in analyses if "data" in analysis}
+    frames = {
+        name: read_table(os.path.join(base_dir, path))
+        for name, path in spec["data"].items()
+        if name in used
+    }
+
+    tasks = plan_tasks([a for a in analyses if a["function"] != "plot_hte"])
+    outcomes = run_tasks(tasks, frames, n_jobs, executor)
+
+    # a merged call fails for every member when one of them fails,
+    # so the members of a failed call are run again on their own
+    failed = [
+        i
+        for i, (task, outcome) in enumerate(zip(tasks, outcomes))
+        if outcome[2] is not None and len(task["analyses"]) > 1
+    ]
+    if failed:
+        retries = [
+            plan_tasks([analysis])[0]
+            for i in failed
+            for analysis in tasks[i]["analyses"]
+        ]
+        retry_outcomes = run_tasks(retries, frames, n_jobs, executor)
+        kept = sorted(set(range(len(tasks))) - set(failed))
+        tasks = [tasks[i] for i in kept] + retries
+        outcomes = [outcomes[i] for i in kept] + retry_outcomes
+
+    results = {}
+    records = []
+    for task, (result, seconds, error) in zip(tasks, outcomes):
+        for (name, select), analysis in zip(task["members"], task["analyses"]):
+            record = {
+                "name": name,
+                # the declared function, not the merged call
+                "function": analysis["function"],
+                "status": "ok",
+                "seconds": seconds,
+                "shared_by": len(task["members"]),
+                "path": None,
+            }
+            if error is None:
+                results[name] = select(result)
+                record["path"] = write_result(results[name], output, name, file_format)
+            else:
+                record["status"] = error
+            records.append(record)
+
+    records += draw_plots(analyses, results, output, n_jobs)
+    summary = pd.DataFrame.from_records(records)
+    summary.to_csv(os.path.join(output, "_summary.csv"), index=False)
+    return summary
+
+
+def check_spec(spec):
+    """
+    raise ValueError for unknown functions, data, inputs or repeated names
+    """
+    # name -> function of the analyses seen so far
+    functions = {}
+    for analysis in spec["analyses"]:
+        name = analysis.get("name")
+        if name is None or name in functions:
+            raise ValueError(
+                "every analysis needs a unique name, got {!r}".format(name)
+            )
+        function = analysis.get("function")
+        functions[name] = function
+        if function == "plot_hte":
+            if functions.get(analysis.get("input")) != "calculate_hte":
+                raise ValueError(
+                    "{}: input must name an earlier calculate_hte analysis".format(name)
+                )
+        elif function not in FUNCTIONS or function == "evaluate_hte_batch":
+            raise ValueError("{}: unknown function {!r}".format(name, function))
+        elif analysis.get("data") not in spec["data"]:
+            raise ValueError("{}: unknown data {!r}".format(name, analysis.get("data")))
+
+
+def read_table(path):
+    """
+    a dataframe from a parquet, csv, feather or pickle file
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".parquet", ".pq"):
+        return pd.read_parquet(path)
+    if extension == ".csv":
+        return pd.read_csv(path)
+    if extension == ".feather":
+        return pd.read_feather(path)
+    if extension in (".pkl", ".pickle"):
+        return pd.read_pickle(path)
+    raise ValueError("unsupported data file {}".format(path))
+
+
+def plan_tasks(analyses):
+    """
+    merge the analyses into calls
+
+    Returns:
+      a list of tasks {"function", "data", "args", "members", "analyses"},
+      members are (name, select) pairs, select maps the result of the call
+      to the result of one analysis, analyses are the merged analyses
+    """
+    tasks = {}
+    for analysis in analyses:
+        function, data = analysis["function"], analysis["data"]
+        args = dict(analysis.get("args", {}))
+
+        if function == "calculate_hte" and isinstance(args.get("y"), str):
+            outcome = args.pop("y")
+            key = (function, data, _key(args))
+            task = tasks.setdefault(
+                key, {"function": function, "data": data, "args": args, "y": []}
+            )
+            if outcome not in task["y"]:
+                task["y"].append(outcome)
+            task.setdefault("members", []).append((analysis["name"], outcome))
+
+        elif function == "evaluate_hte" and not (
+            args.get("return_curve") or args.get("n_boot")
+        ):
+            criterion, p_x = args.pop("criterion"), args.pop("p_x")
+            # bootstrap options do nothing without n_boot
+            for option in ("return_curve", "n_boot", "conf_level", "random_seed"):
+                args.pop(option, None)
+            key = ("evaluate_hte_batch", data, _key(args))
+            task = tasks.setdefault(
+                key,
+                {
+                    "function": "evaluate_hte_batch",
+                    "data": data,
+                    "args": dict(args, criteria=[], p_x_list=[]),
+                },
+            )
+            for name, value in [("criteria", criterion), ("p_x_list", p_x)]:
+                if value not in task["args"][name]:
+                    task["args"][name].append(value)
+            task.setdefault("members", []).append((analysis["name"], (criterion, p_x)))
+
+        else:
+            key = (function, data, _key(args))
+            task = tasks.setdefault(
+                key, {"function": function, "data": data, "args": args}
+            )
+            task.setdefault("members", []).append((analysis["name"], None))
+
+        # kept to run the analyses of a failed call on their own
+        task.setdefault("analyses", []).append(analysis)
+
+    for task in tasks.values():
+        task["members"] = [
+            (name, _selector(task, part)) for name, part in task["members"]
+        ]
+        if task["function"] == "calculate_hte":
+            outcomes = task.pop("y")
+            task["args"]["y"] = outcomes if len(outcomes) > 1 else outcomes[0]
+    return list(tasks.values())
+
+
+def _key(args):
+    return json.dumps(args, sort_keys=True, default=str)
+
+
+def _selector(task, part):
+    if task["function"] == "calculate_hte":
+        return lambda result: result[result["y"] == part].reset_index(drop=True)
+    if task["function"] == "evaluate_hte_batch":
+        criterion, p_x = part
+        return lambda result: result[
+            (result["criterion_name"] == criterion) & (result["p_x"] == p_x)
+        ].reset_index(drop=True)
+    return lambda result: result
+
+
+def run_tasks(tasks, frames, n_jobs=1, executor="process"):
+    """
+    run the calls, independent of each other, serially or in a pool
+
+    Returns:
+      a list of (result, seconds, error) in the order of tasks
+    """
+    calls = [(task["function"], task["data"], task["args"]) for task in tasks]
+    _frames.update(frames)
+    try:
+        if n_jobs == -1:
+            n_jobs = os.cpu_count()
+        if n_jobs == 1 or len(calls) <= 1:
+            return [_run_call(*call) for call in calls]
+        if executor == "thread":
+            pool = ThreadPoolExecutor(n_jobs)
+        elif executor == "process":
+            # with fork the workers inherit the data instead of unpickling it
+            methods = multiprocessing.get_all_start_methods()
+            if "fork" in methods:
+                pool = ProcessPoolExecutor(
+                    n_jobs, mp_context=multiprocessing.get_context("fork")
+                )
+            else:
+                pool = ProcessPoolExecutor(
+                    n_jobs, initializer=_frames.update, initargs=(frames,)
+                )
+        else:
+            raise ValueError("executor must be 'process' or 'thread'")
+        with pool:
+            return list(pool.map(_run_call, *zip(*calls)))
+    finally:
+        _frames.clear()
+
+
+def _run_call(function, data, args):
+    module = importlib.import_module("." + FUNCTIONS[function], __package__)
+    start = time.perf_counter()
+    try:
+        result = getattr(module, function)(_frames[data], **args)
+    except Exception as error:
+        # one failing analysis does not stop the others
+        return [None, time.perf_counter() - start, "error: {!r}".format(error)]
+    return [result, time.perf_counter() - start, None]
+
+
+def write_result(result, output, name, file_format):
+    """
+    write the result of one analysis (evaluate_hte curves go to <name>_curve)
+
+    Returns:
+      the path of the written file
+    """
+    if isinstance(result, dict):
+        result = dict(result)
+        curve = result.pop("curve", None)
+        if curve is not None:
+            write_result(curve, output, name + "_curve", file_format)
+        result = pd.DataFrame.from_records([result])
+    path = os.path.join(output, "{}.{}".format(name, file_format))
+    if file_format == "csv":
+        result.to_csv(path, index=False)
+    else:
+        # parquet columns need one type, e.g. category names next to "all"
+        for col in result.columns[result.dtypes == object]:
+            kinds = {type(value) for value in result[col] if value is not None}
+            if len(kinds) > 1:
+                result = result.assign(**{col: result[col].astype(str)})
+        result.to_parquet(path, index=False)
+    return path
+
+
+def draw_plots(analyses, results, output, n_jobs=1):
+    """
+    plot_hte analyses, one plot_hte_batch call per set of options
+
+    Returns:
+      summary records of the plots
+    """
+    from .hte_tools.plot_hte import plot_hte_batch
+
+    groups = {}
+    records = []
+    for analysis in analyses:
+        if analysis["function"] != "plot_hte":
+            continue
+        record = {
+            "name": analysis["name"],
+            "function": "plot_hte",
+            "status": "ok",
+            "seconds": 0.0,
+            "shared_by": 1,
+            "path": None,
+        }
+        records.append(record)
+        if analysis["input"] not in results:
+            record["status"] = "error: no result of {}".format(analysis["input"])
+            continue
+        args = dict(analysis.get("args", {}))
+        file_format = args.pop("file_format", "png")
+        unknown = set(args) - set(PLOT_OPTIONS)
+        if unknown:
+            record["status"] = "error: unknown options {}".format(sorted(unknown))
+            continue
+        group = groups.setdefault((_key(args), file_format), [args, file_format, []])
+        group[2].append(record)
+
+    for args, file_format, group_records in groups.values():
+        start = time.perf_counter()
+        if "fig_size" in args:
+            args["fig_size"] = tuple(args["fig_size"])
+        by_name = {
+            record["name"]: results[_input(analyses, record["name"])]
+            for record in group_records
+        }
+        paths = plot_hte_batch(
+            by_name,
+            output,
+            layout="files",
+            file_format=file_format,
+            n_jobs=n_jobs,
+            **args,
+        )
+        seconds = time.perf_counter() - start
+        for record, path in zip(group_records, paths):
+            record.update(seconds=seconds, shared_by=len(group_records), path=path)
+    return records
+
+
+def _input(analyses, name):
+    return next(a["input"] for a in analyses if a["name"] == name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="run the analyses of a json spec file, see run_batch"
+    )
+    parser.add_argument("spec", help="path of the json spec file")
+    parser.add_argument("--n-jobs", type=int, default=1, help="-1 uses all cores")
+    parser.add_argument("--executor", default="process", choices=["process", "thread"])
+    parser.add_argument("--output", default=None, help="overrides the spec")
+    parser.add_argument("--format", default=None, choices=["parquet", "csv"])
+    args = parser.parse_args(argv)
+
+    output = None if args.output is None else os.path.abspath(args.output)
+    summary = run_batch(args.spec, args.n_jobs, args.executor, output, args.format)
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(summary.to_string(index=False))
+    return 0 if (summary["status"] == "ok").all() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from ..profiling import stage
+
+# numpy engine for calculate_score:
+# the subsample regressions of many rounds are solved together
+# and the scores are accumulated with one bincount
+
+
+def draw_subsamples(n, subsample_size, replacement, num_rounds, rng):
+    """
+    row positions of the subsamples, one row per round
+
+    Args:
+      n: number of rows
+      subsample_size: rows per round
+      replacement: sampling with replacement
+      num_rounds: number of rounds
+      rng: np.random (the global state) or a np.random.Generator
+
+    Returns:
+      an array with shape (num_rounds, subsample_size)
+    """
+    if replacement and isinstance(rng, np.random.Generator):
+        return rng.integers(0, n, size=(num_rounds, subsample_size))
+    # the same calls as the sklearn engine, so the global state gives the same draws
+    return np.stack(
+        [
+            rng.choice(n, size=subsample_size, replace=replacement)
+            for _ in range(num_rounds)
+        ]
+    )
+
+
+def treatment_coefficients(X, Y):
+    """
+    coefficient of the first column of X in a regression with intercept,
+    leading dimensions are treated as a batch
+
+    Args:
+      X: regressors with shape (..., n, k), treatment first
+      Y: outcome with shape (..., n)
+
+    Returns:
+      coefficients with shape (...)
+    """
+    # centering removes the intercept (as in sklearn)
+    X = X - X.mean(axis=-2, keepdims=True)
+    Y = Y - Y.mean(axis=-1, keepdims=True)
+    Xt = np.swapaxes(X, -1, -2)
+    xx = Xt @ X
+    xy = Xt @ Y[..., None]
+    try:
+        coef = np.linalg.solve(xx, xy)
+    except np.linalg.LinAlgError:
+        # minimum norm solution for collinear subsamples, like lstsq
+        coef = np.linalg.pinv(xx) @ xy
+    return coef[..., 0, 0]
+
+
+def subsample_contributions(X, Y, sample_index, tau_0, minus_tau_0, max_elements=2**24):
+    """
+    score contribution of every round, solved in batches of rounds
+
+    Args:
+      X: regressors with shape (n, k), treatment first
+      Y: outcome with shape (n,)
+      sample_index: subsamples from draw_subsamples
+      tau_0: full sample treatment effect
+      minus_tau_0: whether tau_0 is subtracted
+      max_elements: size limit of the gathered regressors of one batch
+
+    Returns:
+      an array with one contribution per round
+    """
+    num_rounds, subsample_size = sample_index.shape
+    batch = max(1, max_elements // (subsample_size * X.shape[1]))
+    tau = np.concatenate(
+        [
+            treatment_coefficients(X[rows], Y[rows])
+            for rows in np.array_split(sample_index, range(batch, num_rounds, batch))
+        ]
+    )
+    return tau - tau_0 * minus_tau_0
+
+
+def accumulate_scores(n, sample_index, contributions):
+    """
+    add each round's contribution to its sampled rows
+    (a row drawn twice in one round is counted once, as with df.loc +=)
+
+    Args:
+      n: number of rows
+      sample_index: subsamples from draw_subsamples
+      contributions: one value per round
+
+    Returns:
+      the score of every row
+    """
+    rows = np.sort(sample_index, axis=1)
+    first = np.ones(rows.shape, dtype=bool)
+    first[:, 1:] = rows[:, 1:] != rows[:, :-1]
+    weights = np.broadcast_to(contributions[:, None], rows.shape)
+    return np.bincount(rows[first], weights=weights[first], minlength=n)
+
+
+def score_block(X, Y, rng, num_rounds, subsample_size, replacement, tau_0, minus_tau_0):
+    """
+    scores of a block of rounds drawn from one random stream
+
+    Returns:
+      a list [scores, contributions of the rounds]
+    """
+    sample_index = draw_subsamples(len(Y), subsample_size, replacement, num_rounds, rng)
+    contributions = subsample_contributions(X, Y, sample_index, tau_0, minus_tau_0)
+    return [accumulate_scores(len(Y), sample_index, contributions), contributions]
+
+
+_worker_data = {}
+
+
+def _init_worker(X, Y):
+    _worker_data["X"] = X
+    _worker_data["Y"] = Y
+
+
+def _score_block_worker(seed, num_rounds, *args):
+    rng = np.random.default_rng(seed)
+    return score_block(_worker_data["X"], _worker_data["Y"], rng, num_rounds, *args)
+
+
+def calculate_score_numpy(
+    df,
+    t,
+    X_exo,
+    y,
+    subsample_size,
+    replacement,
+    minus_tau_0,
+    num_rounds,
+    random_seed,
+    n_jobs=1,
+    block_rounds=25,
+    tol=None,
+):
+    """
+    calculate_score with engine="numpy":
+    rounds run in blocks of block_rounds, block b draws from the b-th
+    SeedSequence(random_seed).spawn stream and the block scores are added
+    in block order, so the scores do not depend on n_jobs
+    (random_seed=None draws from the global state like the sklearn engine)
+
+    with tol, stop after the first block where the root mean square change
+    of the per round scores (score / rounds) is below tol times their scale,
+    subsample_size / n times the root mean square contribution of a round
+    (the per round score of a row that is always sampled).
+    the score is then rescaled to num_rounds rounds,
+    so runs stopping at different rounds are comparable
+
+    Returns:
+      the number of rounds run
+    """
+    with stage("full fit", df.shape[0]):
+        X = df[[t] + X_exo].to_numpy(dtype=np.float64)
+        Y = df[y].to_numpy(dtype=np.float64)
+        tau_0 = treatment_coefficients(X, Y)
+    block_sizes = [
+        min(block_rounds, num_rounds - start)
+        for start in range(0, num_rounds, block_rounds)
+    ]
+    args = (subsample_size, replacement, tau_0, minus_tau_0)
+
+    if random_seed is None:
+        if n_jobs != 1:
+            raise ValueError("n_jobs != 1 needs a random_seed")
+        blocks = (score_block(X, Y, np.random, size, *args) for size in block_sizes)
+    else:
+        seeds = np.random.SeedSequence(random_seed).spawn(len(block_sizes))
+        if n_jobs == 1:
+            blocks = (
+                score_block(X, Y, np.random.default_rng(seed), size, *args)
+                for seed, size in zip(seeds, block_sizes)
+            )
+        else:
+            blocks = _parallel_blocks(X, Y, seeds, block_sizes, args, n_jobs)
+
+    n = df.shape[0]
+    score = np.zeros(n)
+    rounds = 0
+    squares = 0.0
+    for size, (block, contributions) in zip(
+        block_sizes, _timed_blocks(blocks, subsample_size)
+    ):
+        previous = score / rounds if tol is not None and rounds else None
+        score += block
+        rounds += size
+        squares += contributions @ contributions
+        if previous is not None:
+            # the per round scores shrink with minus_tau_0, so the change is
+            # compared with the spread of the contributions, not with the scores
+            change = np.sqrt(np.mean((score / rounds - previous) ** 2))
+            scale = subsample_size / n * np.sqrt(squares / rounds)
+            if change <= tol * scale:
+                break
+    if hasattr(blocks, "close"):
+        blocks.close()
+
+    if rounds < num_rounds:
+        score *= num_rounds / rounds
+    df["score"] = score
+    return rounds
+
+
+def _timed_blocks(blocks, subsample_size):
+    # the blocks are lazy, so each one is computed inside its stage
+    blocks = iter(blocks)
+    while True:
+        with stage("block", subsample_size):
+            block = next(blocks, None)
+        if block is None:
+            return
+        yield block
+
+
+def _parallel_blocks(X, Y, seeds, block_sizes, args, n_jobs):
+    # blocks are computed in waves of n_jobs and yielded in order,
+    # so stopping early does not run far ahead of the check
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    with ProcessPoolExecutor(n_jobs, initializer=_init_worker, initargs=(X, Y)) as pool:
+        for start in range(0, len(seeds), n_jobs):
+            wave = slice(start, start + n_jobs)
+            yield from pool.map(
+                _score_block_worker,
+                seeds[wave],
+                block_sizes[wave],
+                *[[arg] * len(seeds[wave]) for arg in args],
+            )
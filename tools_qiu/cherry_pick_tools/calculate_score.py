@@ -1,5 +1,6 @@
 import numpy as np
-from sklearn.linear_model import LinearRegression
+from ..profiling import profiled, stage
+from .batched_score import calculate_score_numpy
 
 # sklearn does not provide se/cf and is faster
 
@@ -14,35 +15,74 @@ def update_score(
     minus_tau_0,
     replacement,
 ):
+    from sklearn.linear_model import LinearRegression
+
     sample_index = np.random.choice(
         df.index,
         size=subsample_size,
         replace=replacement,
     )
-    sample_df = df.loc[sample_index]
+    # only the regression columns are copied
+    sample_df = df.loc[sample_index, [t] + X_exo + [y]]
     X = sample_df[[t] + X_exo]
     Y = sample_df[y]
     tau = LinearRegression().fit(X, Y).coef_[0]
     df.loc[sample_index, "score"] += tau - tau_0 * minus_tau_0
 
 
+@profiled
 def calculate_score(df, t, X_exo, y, **kwargs):
     subsample_size = kwargs.get("subsample_size", 1000)
     replacement = kwargs.get("replacement", False)
     minus_tau_0 = kwargs.get("minus_tau_0", True)
     num_rounds = kwargs.get("num_rounds", 500)
-    df["score"] = 0
-    X = df[[t] + X_exo]
-    Y = df[y]
-    tau_0 = LinearRegression().fit(X, Y).coef_[0]
-    for i in range(num_rounds):
-        update_score(
+    # "numpy" solves all rounds with batched linear algebra
+    engine = kwargs.get("engine", "sklearn")
+    # options of the numpy engine:
+    # random_seed (None draws from the global state), n_jobs (needs a seed),
+    # block_rounds (rounds per random stream) and tol (stop once stable)
+    random_seed = kwargs.get("random_seed", None)
+    if engine != "numpy":
+        # the sklearn engine would silently ignore them
+        ignored = [
+            name
+            for name in ["random_seed", "n_jobs", "block_rounds", "tol"]
+            if kwargs.get(name) is not None
+        ]
+        if ignored:
+            raise ValueError("{} need engine='numpy'".format(", ".join(ignored)))
+    if engine == "numpy":
+        return calculate_score_numpy(
             df=df,
-            subsample_size=subsample_size,
             t=t,
             X_exo=X_exo,
             y=y,
-            tau_0=tau_0,
-            minus_tau_0=minus_tau_0,
+            subsample_size=subsample_size,
             replacement=replacement,
+            minus_tau_0=minus_tau_0,
+            num_rounds=num_rounds,
+            random_seed=random_seed,
+            n_jobs=kwargs.get("n_jobs", 1),
+            block_rounds=kwargs.get("block_rounds", 25),
+            tol=kwargs.get("tol", None),
         )
+    from sklearn.linear_model import LinearRegression
+
+    df["score"] = 0.0
+    with stage("full fit", df.shape[0]):
+        X = df[[t] + X_exo]
+        Y = df[y]
+        tau_0 = LinearRegression().fit(X, Y).coef_[0]
+    for i in range(num_rounds):
+        with stage("round", subsample_size):
+            update_score(
+                df=df,
+                subsample_size=subsample_size,
+                t=t,
+                X_exo=X_exo,
+                y=y,
+                tau_0=tau_0,
+                minus_tau_0=minus_tau_0,
+                replacement=replacement,
+            )
+    return num_rounds
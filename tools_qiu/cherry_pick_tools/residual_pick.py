@@ -1,52 +1,74 @@
 import numpy as np
-from sklearn.linear_model import LinearRegression
+import pandas as pd
+from ..data_prep import as_pandas
+from ..profiling import profiled, stage
 
 # cherry pick based on residuals
 
 
-def residual_pick(df, t, X_exo, y, pick_share, include_t=True):
+@profiled
+def residual_pick(df, t, X_exo, y, pick_share, include_t=True, full_output=True):
     """
     pick the pick_share % of the data
     (with ties, obtain more data)
 
     Args:
-      df: data
-      pick_share: between 0-100
+      df: data (a pandas DataFrame, an Arrow table or a Polars DataFrame)
+      pick_share: between 0-100, or a list of shares
+        (one residual_pick_<share> column per share)
       include_t: optional when the ATE = 0
+      full_output: return all columns of df,
+        otherwise only the residual and pick columns (df is never modified)
 
     Returns:
       df with the residuals
       and the addtional column indicating whether a row is picked
     """
-    df = df.copy()
-    if X_exo is None:
-        Y = df[y]
-        if include_t:
-            X = df[[t]]
+    from sklearn.linear_model import LinearRegression
+
+    X_exo_cols = [] if X_exo is None else list(X_exo)
+    df = as_pandas(df, None if full_output else [t] + X_exo_cols + [y])
+    with stage("fit residuals", df.shape[0]):
+        if X_exo is None:
+            Y = df[y]
+            if include_t:
+                X = df[[t]]
+                model = LinearRegression().fit(X, Y)
+                res = Y - model.predict(X)
+            else:
+                res = Y - Y.mean()
+        else:
+            if include_t:
+                X = df[[t] + X_exo]
+            else:
+                X = df[X_exo]
+            Y = df[y]
             model = LinearRegression().fit(X, Y)
             res = Y - model.predict(X)
-        else:
-            res = Y - Y.mean()
-    else:
-        if include_t:
-            X = df[[t] + X_exo]
-        else:
-            X = df[X_exo]
-        Y = df[y]
-        model = LinearRegression().fit(X, Y)
-        res = Y - model.predict(X)
-    df = df.assign(residual=res)
-
-    threshold_0 = df.loc[df[t] == 0, "residual"].quantile(pick_share / 100)
-    threshold_1 = df.loc[df[t] == 1, "residual"].quantile(1 - pick_share / 100)
-
-    df["residual_pick"] = 0
-    df["residual_pick"] = df.apply(
-        lambda row: 1
-        if (row[t] == 1 and row["residual"] >= threshold_1)
-        or (row[t] == 0 and row["residual"] <= threshold_0)
-        else 0,
-        axis=1,
-    )
-
-    return df
+        residual = np.asarray(res, dtype=np.float64)
+    treatment = df[t].to_numpy()
+
+    # rank the residuals of each arm once for all shares
+    shares = pick_share if isinstance(pick_share, (list, tuple)) else [pick_share]
+    q = np.array(shares) / 100
+    is_1 = treatment == 1
+    is_0 = treatment == 0
+    with stage("quantiles", df.shape[0]):
+        thresholds_0 = np.quantile(residual[is_0], q)
+        thresholds_1 = np.quantile(residual[is_1], 1 - q)
+
+    with stage("result assembly", df.shape[0]):
+        picks = {}
+        for share, threshold_0, threshold_1 in zip(shares, thresholds_0, thresholds_1):
+            col_name = (
+                "residual_pick"
+                if shares is not pick_share
+                else "residual_pick_{}".format(share)
+            )
+            picks[col_name] = (
+                (is_1 & (residual >= threshold_1)) | (is_0 & (residual <= threshold_0))
+            ).astype(np.int64)
+
+        if full_output:
+            return df.assign(residual=residual, **picks)
+        return pd.DataFrame({"residual": residual, **picks}, index=df.index)
@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+
+# shared column extraction for the numpy code paths.
+# only the columns a call needs are read, into contiguous arrays with
+# compact dtypes; the caller's dataframe is never modified or copied.
+# Arrow tables and Polars frames are read through as_pandas
+
+
+def regression_columns(t, X_exo, X_end, y, iv):
+    """
+    the columns used by a calculate_te regression, in the linearmodels order:
+    t, X_exo, X_end (if iv) and the outcomes
+    """
+    X_exo = [] if X_exo is None else list(X_exo)
+    outcomes = y if isinstance(y, list) else [y]
+    return [t] + X_exo + ([X_end] if iv else []) + outcomes
+
+
+def treatment_array(values):
+    """
+    a 0/1 treatment as a bool array (1 byte per row),
+    other values are kept as float64
+
+    Args:
+      values: series or array
+
+    Returns:
+      an array
+    """
+    values = np.asarray(values)
+    if values.dtype == np.bool_:
+        return values
+    is_t = values == 1
+    if np.count_nonzero(is_t) + np.count_nonzero(values == 0) == len(values):
+        return is_t
+    return values.astype(np.float64)
+
+
+def numeric_array(values, float32=False):
+    """
+    a contiguous float64 (or float32) array of a column
+    (no copy when the column already has that dtype)
+    """
+    dtype = np.float32 if float32 else np.float64
+    return np.ascontiguousarray(np.asarray(values, dtype=dtype))
+
+
+def category_codes(values):
+    """
+    codes of a criterion column and the value of every code
+    (missing values get -1)
+
+    Returns:
+      a list [codes, uniques]
+    """
+    codes, uniques = pd.factorize(values)
+    return [codes, list(uniques)]
+
+
+def compact_columns(columns):
+    """
+    compact simulator output: no constant intercept column,
+    a 0/1 treatment as int8
+
+    Args:
+      columns: dictionary {column: array}
+
+    Returns:
+      a dictionary {column: array}
+    """
+    columns = {name: col for name, col in columns.items() if name != "intercept"}
+    columns["treatment"] = columns["treatment"].astype(np.int8)
+    return columns
+
+
+def as_pandas(data, columns=None):
+    """
+    a pandas dataframe with some columns of a pandas, Arrow or Polars frame
+    (pandas input is returned as it is, numeric Arrow and Polars columns
+    without missing values are read-only views of their buffers, not copies)
+
+    Args:
+      data: pd.DataFrame, pyarrow.Table or polars.DataFrame
+      columns: the columns to read (None for all)
+
+    Returns:
+      a pd.DataFrame
+    """
+    if isinstance(data, pd.DataFrame):
+        return data
+    module = type(data).__module__.split(".")[0]
+    if module == "polars":
+        if columns is not None:
+            data = data.select(list(dict.fromkeys(columns)))
+        # numeric polars columns are arrow buffers, to_arrow does not copy them
+        data = data.to_arrow()
+    elif module != "pyarrow":
+        raise TypeError(
+            "data must be a pandas DataFrame, an Arrow table or a Polars DataFrame"
+        )
+    if columns is None:
+        columns = data.column_names
+    arrays = {
+        name: arrow_to_numpy(data.column(name)) for name in dict.fromkeys(columns)
+    }
+    return pd.DataFrame(arrays, copy=False)
+
+
+def arrow_to_numpy(column):
+    """
+    numpy array of an Arrow column,
+    zero-copy for a single chunk of numbers without nulls
+    """
+    if hasattr(column, "num_chunks"):
+        if column.num_chunks == 1:
+            column = column.chunk(0)
+        else:
+            column = column.combine_chunks()
+    return column.to_numpy(zero_copy_only=False)
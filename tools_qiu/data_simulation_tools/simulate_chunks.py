@@ -0,0 +1,209 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from .simulate_iv import DEFAULT_DATA_GENERATION_PARAMETERS as IV_PARAMETERS
+from .simulate_iv import generate_iv
+from .simulate_rct import DEFAULT_DATA_GENERATION_PARAMETERS as RCT_PARAMETERS
+from .simulate_rct import generate_rct
+
+# streaming versions of simulate_rct and simulate_iv.
+# rows are drawn in fixed blocks of block_size, block b uses its own
+# np.random.Generator seeded with SeedSequence(random_seed, spawn_key=(b,)),
+# so the data only depends on random_seed and block_size,
+# not on chunk_size or the number of workers
+
+SIMULATORS = {
+    "rct": (generate_rct, RCT_PARAMETERS),
+    "iv": (generate_iv, IV_PARAMETERS),
+}
+
+
+def simulate_chunks(
+    simulator="rct",
+    data_generation_parameters=None,
+    random_seed=10086,
+    log_normal=True,
+    chunk_size=1_000_000,
+    block_size=65_536,
+    as_records=False,
+):
+    """
+    simulate RCT or IV data chunk by chunk.
+
+    Args:
+        simulator (str): "rct" or "iv".
+        data_generation_parameters (dict): As in simulate_rct / simulate_iv.
+        random_seed (int): Seed of the block streams.
+        log_normal (bool): If True, applies exponential transformation to generated samples.
+        chunk_size (int): Rows per chunk (the last chunk may be shorter).
+        block_size (int): Rows per random stream.
+        as_records (bool): Yield numpy record arrays instead of dataframes.
+
+    Yields:
+        pd.DataFrame or np.recarray: Consecutive chunks with an obs_index column.
+    """
+    _, default_parameters = SIMULATORS[simulator]
+    if data_generation_parameters is None:
+        data_generation_parameters = default_parameters
+    sample_size = data_generation_parameters["sample_size"]
+
+    # blocks not yielded yet, the first one from row offset on
+    pending = deque()
+    offset = 0
+    n_pending = 0
+    for block in range(-(-sample_size // block_size)):
+        rows = simulate_block(
+            simulator,
+            data_generation_parameters,
+            random_seed,
+            log_normal,
+            block,
+            block_size,
+        )
+        pending.append(rows)
+        n_pending += len(rows)
+        while n_pending >= chunk_size:
+            parts, offset = _take(pending, offset, chunk_size)
+            n_pending -= chunk_size
+            yield _as_chunk(parts, as_records)
+    if n_pending > 0:
+        yield _as_chunk(_take(pending, offset, n_pending)[0], as_records)
+
+
+def _take(pending, offset, size):
+    """
+    slices of the next size pending rows (each row is copied at most once,
+    when a chunk spans several blocks)
+
+    Returns:
+      a list [slices, offset in the new first pending block]
+    """
+    parts = []
+    while size > 0:
+        head = pending[0]
+        n = min(size, len(head) - offset)
+        parts.append(head[offset : offset + n])
+        offset += n
+        size -= n
+        if offset == len(head):
+            pending.popleft()
+            offset = 0
+    return [parts, offset]
+
+
+def _as_chunk(parts, as_records):
+    rows = parts[0] if len(parts) == 1 else np.concatenate(parts)
+    return rows.view(np.recarray) if as_records else pd.DataFrame(rows)
+
+
+def simulate_block(
+    simulator, data_generation_parameters, random_seed, log_normal, block, block_size
+):
+    """
+    draw one block of rows as a structured array
+    """
+    generate, _ = SIMULATORS[simulator]
+    sample_size = data_generation_parameters["sample_size"]
+    start = block * block_size
+    size = min(block_size, sample_size - start)
+    rng = np.random.default_rng(np.random.SeedSequence(random_seed, spawn_key=(block,)))
+    columns = generate(data_generation_parameters, rng, size, log_normal)
+    columns["obs_index"] = np.arange(start + 1, start + size + 1)
+    rows = np.empty(size, dtype=[(name, col.dtype) for name, col in columns.items()])
+    for name, col in columns.items():
+        rows[name] = col
+    return rows
+
+
+def write_simulation(
+    path,
+    simulator="rct",
+    data_generation_parameters=None,
+    random_seed=10086,
+    log_normal=True,
+    block_size=65_536,
+    file_format="npy",
+    n_jobs=1,
+):
+    """
+    simulate RCT or IV data straight to disk.
+
+    Args:
+        path (str): Output file.
+        simulator, data_generation_parameters, random_seed, log_normal, block_size:
+            See simulate_chunks.
+        file_format (str): "npy" (a structured array, open with np.load(mmap_mode="r"))
+            or "parquet" (needs pyarrow, one row group per block).
+        n_jobs (int): Worker processes drawing blocks (-1 for all cores).
+
+    Returns:
+        str: The path.
+    """
+    _, default_parameters = SIMULATORS[simulator]
+    if data_generation_parameters is None:
+        data_generation_parameters = default_parameters
+    sample_size = data_generation_parameters["sample_size"]
+    n_blocks = -(-sample_size // block_size)
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+
+    args = (simulator, data_generation_parameters, random_seed, log_normal)
+    if file_format == "npy":
+        dtype = simulate_block(*args, 0, 1).dtype
+        out = np.lib.format.open_memmap(
+            path, mode="w+", dtype=dtype, shape=(sample_size,)
+        )
+        del out
+        # every worker writes its own blocks into the memory-mapped file
+        tasks = [(path, *args, block, block_size) for block in range(n_blocks)]
+        if n_jobs == 1:
+            for task in tasks:
+                _write_npy_block(*task)
+        else:
+            with ProcessPoolExecutor(n_jobs) as pool:
+                list(pool.map(_write_npy_block, *zip(*tasks)))
+    elif file_format == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+        try:
+            for rows in _ordered_blocks(args, n_blocks, block_size, n_jobs):
+                table = pa.table({name: rows[name] for name in rows.dtype.names})
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        raise ValueError("file_format must be 'npy' or 'parquet'")
+
+    return path
+
+
+def _write_npy_block(path, *args):
+    rows = simulate_block(*args)
+    block, block_size = args[-2:]
+    out = np.load(path, mmap_mode="r+")
+    out[block * block_size : block * block_size + len(rows)] = rows
+    out.flush()
+
+
+def _ordered_blocks(args, n_blocks, block_size, n_jobs):
+    # blocks are drawn in waves and yielded in order,
+    # so the file does not depend on n_jobs and memory stays bounded
+    if n_jobs == 1:
+        for block in range(n_blocks):
+            yield simulate_block(*args, block, block_size)
+        return
+    with ProcessPoolExecutor(n_jobs) as pool:
+        for start in range(0, n_blocks, 2 * n_jobs):
+            wave = range(start, min(start + 2 * n_jobs, n_blocks))
+            yield from pool.map(
+                simulate_block,
+                *zip(*[(*args, block, block_size) for block in wave]),
+            )
@@ -1,13 +1,30 @@
 import numpy as np
 import pandas as pd
+from ..data_prep import compact_columns
 
+DEFAULT_DATA_GENERATION_PARAMETERS = {
+    "sample_size": 2000,
+    "treatment_proportion": 0.3,
+    "normal_mean": np.array([0, 0, 0]),
+    # covariance matrix for x1, epsilon, delta
+    "normal_cov": np.array([[1, 0.7, -0.5], [0.7, 1, -0.4], [-0.5, -0.4, 1]]),
+    # coefficients for x: intercept, treatment_effect, x1, epsilon, delta
+    "coefficients": np.array([3, -2, 0.3, 1, 0]),
+    # coefficients for y: intercept, x, x1, epsilon, delta
+    "iv_coefficients": np.array([400, -3, -0.15, 0, 1]),
+}
 
-def simulate_iv(data_generation_parameters=None, random_seed=10086, log_normal=True):
+
+def simulate_iv(
+    data_generation_parameters=None, random_seed=10086, log_normal=True, compact=False
+):
     """
     simulate IV data.
 
     Args:
         log_normal (bool): If True, applies exponential transformation to generated samples.
+        compact (bool): If True, drops the constant intercept column
+            and stores the treatment as int8 (the same values otherwise).
 
     Returns:
         pd.DataFrame: Simulated IV data.
@@ -16,44 +33,66 @@ def simulate_iv(data_generation_parameters=None, random_seed=10086, log_normal=T
         np.random.seed(random_seed)
 
     if data_generation_parameters is None:
-        data_generation_parameters = {
-            "sample_size": 2000,
-            "treatment_proportion": 0.3,
-            "normal_mean": np.array([0, 0, 0]),
-            # covariance matrix for x1, epsilon, delta
-            "normal_cov": np.array([[1, 0.7, -0.5], [0.7, 1, -0.4], [-0.5, -0.4, 1]]),
-            # coefficients for x: intercept, treatment_effect, x1, epsilon, delta
-            "coefficients": np.array([3, -2, 0.3, 1, 0]),
-            # coefficients for y: intercept, x, x1, epsilon, delta
-            "iv_coefficients": np.array([400, -3, -0.15, 0, 1]),
-        }
-
-    samples = np.random.multivariate_normal(
+        data_generation_parameters = DEFAULT_DATA_GENERATION_PARAMETERS
+
+    columns = generate_iv(
+        data_generation_parameters,
+        np.random,
+        data_generation_parameters["sample_size"],
+        log_normal,
+    )
+    if compact:
+        columns = compact_columns(columns)
+    df = pd.DataFrame(columns, copy=False)
+
+    df["obs_index"] = np.arange(1, data_generation_parameters["sample_size"] + 1)
+
+    return df
+
+
+def generate_iv(data_generation_parameters, rng, size, log_normal):
+    """
+    draw IV columns.
+
+    Args:
+        data_generation_parameters (dict): See DEFAULT_DATA_GENERATION_PARAMETERS.
+        rng: np.random (the global state) or a np.random.Generator.
+        size (int): Number of rows to draw.
+        log_normal (bool): If True, applies exponential transformation to generated samples.
+
+    Returns:
+        dict: Column name to array.
+    """
+    samples = rng.multivariate_normal(
         data_generation_parameters["normal_mean"],
         data_generation_parameters["normal_cov"],
-        size=data_generation_parameters["sample_size"],
+        size=size,
     )
 
-    treatment_assignment = np.random.binomial(
+    treatment_assignment = rng.binomial(
         n=1,
         p=data_generation_parameters["treatment_proportion"],
-        size=data_generation_parameters["sample_size"],
+        size=size,
     )
 
-    df = pd.DataFrame(samples, columns=["x1", "epsilon", "delta"])
-
     if log_normal:
-        df = df.apply(lambda x: np.exp(x))
+        samples = np.exp(samples)
 
-    df["treatment"] = treatment_assignment
-    df["intercept"] = 1
-    df["x"] = df[["intercept", "treatment", "x1", "epsilon", "delta"]].dot(
-        data_generation_parameters["coefficients"]
-    )
-    df["y"] = df[["intercept", "x", "x1", "epsilon", "delta"]].dot(
-        data_generation_parameters["iv_coefficients"]
+    intercept = np.ones(size, dtype=treatment_assignment.dtype)
+    # column-major like the values of a dataframe, so the dot is bitwise the same
+    design = np.asfortranarray(
+        np.column_stack([intercept, treatment_assignment, samples])
     )
+    x = design.dot(data_generation_parameters["coefficients"])
+    design[:, 1] = x
+    y = design.dot(data_generation_parameters["iv_coefficients"])
 
-    df["obs_index"] = np.arange(1, data_generation_parameters["sample_size"] + 1)
-
-    return df
+    return {
+        "x1": samples[:, 0],
+        "epsilon": samples[:, 1],
+        "delta": samples[:, 2],
+        "treatment": treatment_assignment,
+        "intercept": intercept,
+        "x": x,
+        "y": y,
+    }
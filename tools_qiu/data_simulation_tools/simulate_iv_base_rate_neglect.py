@@ -1,98 +1,217 @@
 import numpy as np
 import pandas as pd
 from ..te_tools.calculate_te import calculate_te
-
-
-def simulate_iv_base_rate_neglect():
+from ..te_tools.te_accumulator import TEAccumulator
+
+# three types of users
+# each have 10000 users
+# type 1: dy/dx = 1/2
+# type 2: dy/dx = 1/3
+# type 3: dy/dx = 101/300
+DEFAULT_USER_TYPES = [
+    {"size": 10000, "first_stage": 2, "second_stage": 1 / 2, "scale": 1},
+    {"size": 10000, "first_stage": 3, "second_stage": 1 / 3, "scale": 1},
+    {
+        "size": 10000,
+        "first_stage": 300,
+        "second_stage": 101 / 300,
+        "scale": 100,
+    },
+]
+
+
+def simulate_iv_base_rate_neglect(
+    user_types=None,
+    random_seed=None,
+    estimate=True,
+    engine="linearmodels",
+    chunk_size=None,
+):
     """
     simulate a df for demonstrating the base rate neglect in iv estimation
 
     Args:
+      user_types: list of dictionaries, one per type of users, with
+        size: number of users,
+        first_stage: dx/dt,
+        second_stage: dy/dx,
+        scale: factor applied to x1, x2, epsilon and delta
+      random_seed: seed of the global random state (None keeps the current state)
+        or a np.random.Generator (faster for very large samples)
+      estimate: whether to run the iv regressions
+      engine: engine of calculate_te
+      chunk_size: draw and estimate at most chunk_size rows at a time, so
+        memory does not grow with the sample size; the df is not kept
+        (None is returned instead) and the estimates come from incremental
+        statistics (TEAccumulator, the same results as engine="numpy" on
+        the same rows). the draws differ from chunk_size=None, the rows
+        are those of base_rate_neglect_chunks with the same random_seed.
+        needs estimate=True
 
     Returns:
       a list [dataframe, results_in_dictionary]
     """
 
-    # three types of users
-    # each have 1000 users
-    # type 1: dy/dx = 1/2
-    # type 2: dy/dx = 1/3
-    # type 3: dy/dx = 101/300
+    if user_types is None:
+        user_types = DEFAULT_USER_TYPES
+
+    if chunk_size is not None:
+        if not estimate:
+            raise ValueError(
+                "chunk_size without estimate keeps nothing, "
+                "use base_rate_neglect_chunks to get the rows"
+            )
+        chunks = base_rate_neglect_chunks(user_types, random_seed, chunk_size)
+        return [None, estimate_chunks(user_types, chunks)]
+
+    rng = random_state(random_seed)
+
+    sizes = [user_type["size"] for user_type in user_types]
+    user_type = np.repeat(np.arange(len(user_types)), sizes)
+    df = draw_users(user_types, user_type, rng)
+
+    result_dict = {}
+    if estimate:
+
+        def iv_effect(subset):
+            return calculate_te(
+                subset,
+                "treatment",
+                ["x2"],
+                "x",
+                "y",
+                iv=True,
+                conf_level=0.95,
+                engine=engine,
+            )["te"]
+
+        # run iv seperately
+        for k in range(1, len(user_types) + 1):
+            result_dict["iv_effect_type_{}".format(k)] = iv_effect(
+                df.loc[df["type"] == k]
+            )
+
+        # run iv for 1&k
+        for k in range(2, len(user_types) + 1):
+            result_dict["iv_effect_type_1_plus_{}".format(k)] = iv_effect(
+                df.loc[df["type"].isin([1, k])]
+            )
+
+    return [df, result_dict]
+
+
+def draw_users(user_types, user_type, rng):
+    """
+    draw the rows of users with the given type positions
+
+    Args:
+      user_types: see simulate_iv_base_rate_neglect
+      user_type: position in user_types of every row
+      rng: np.random (the global state) or a np.random.Generator
+
+    Returns:
+      a dataframe
+    """
+    sample_size = len(user_type)
+
+    # per type coefficients, looked up by the type of each row
+    first_stage = np.array([user_type["first_stage"] for user_type in user_types])
+    second_stage = np.array([user_type["second_stage"] for user_type in user_types])
+    scale = np.array([user_type["scale"] for user_type in user_types], dtype=float)
 
     # data generating process
     # x, epsilon, delta
-    samples = np.random.multivariate_normal(
+    samples = rng.multivariate_normal(
         np.array([0, 0, 0]),
         np.array([[1, 0.7, -0.5], [0.7, 1, -0.4], [-0.5, -0.4, 1]]),
-        size=30000,
+        size=sample_size,
     )
-    df = pd.DataFrame(samples, columns=["x1", "epsilon", "delta"])
     # add some exogenous variable
-    df["x2"] = np.random.standard_normal(size=30000)
-    # assign types
-    df["type"] = 0
-    df.loc[:9999, "type"] = 1
-    df.loc[10000:19999, "type"] = 2
-    df.loc[20000:, "type"] = 3
+    x2 = rng.standard_normal(size=sample_size)
     # assign treatment
-    df["treatment"] = np.random.binomial(
+    treatment = rng.binomial(
         n=1,
         p=0.5,
-        size=30000,
+        size=sample_size,
     )
-    df.loc[df["type"] == 3, ["x1", "x2", "epsilon", "delta"]] *= 100
+
+    row_scale = scale[user_type]
+    samples *= row_scale[:, None]
+    x2 *= row_scale
+    x1, epsilon, delta = samples.T
 
     # dx/dt
-    def calculate_x(row):
-        if row["type"] == 1:
-            return row["x1"] + row["treatment"] * 2 + row["epsilon"]
-        elif row["type"] == 2:
-            return row["x1"] + row["treatment"] * 3 + row["epsilon"]
-        else:
-            return row["x1"] + row["treatment"] * 300 + row["epsilon"]
+    x = x1 + treatment * first_stage[user_type] + epsilon
+    # dx/dy
+    y = second_stage[user_type] * x + x2 + delta
+
+    return pd.DataFrame(
+        {
+            "x1": x1,
+            "epsilon": epsilon,
+            "delta": delta,
+            "x2": x2,
+            "type": user_type + 1,
+            "treatment": treatment,
+            "x": x,
+            "y": y,
+        },
+        copy=False,
+    )
 
-    df["x"] = df.apply(calculate_x, axis=1)
 
-    # dx/dy
-    def calculate_y(row):
-        if row["type"] == 1:
-            return (1 / 2) * row["x"] + row["x2"] + row["delta"]
-        elif row["type"] == 2:
-            return (1 / 3) * row["x"] + row["x2"] + row["delta"]
-        else:
-            return (101 / 300) * row["x"] + row["x2"] + row["delta"]
-
-    df["y"] = df.apply(calculate_y, axis=1)
-
-    # run iv seperately
-    te1 = calculate_te(
-        df.loc[df["type"] == 1], "treatment", ["x2"], "x", "y", iv=True, conf_level=0.95
-    )["te"]
-
-    te2 = calculate_te(
-        df.loc[df["type"] == 2], "treatment", ["x2"], "x", "y", iv=True, conf_level=0.95
-    )["te"]
-
-    te3 = calculate_te(
-        df.loc[df["type"] == 3], "treatment", ["x2"], "x", "y", iv=True, conf_level=0.95
-    )["te"]
-
-    # run iv for 1&2
-    te1_2 = calculate_te(
-        df.loc[df["type"] < 3], "treatment", ["x2"], "x", "y", iv=True, conf_level=0.95
-    )["te"]
-
-    # run iv for 1&3
-    te1_3 = calculate_te(
-        df.loc[df["type"] != 2], "treatment", ["x2"], "x", "y", iv=True, conf_level=0.95
-    )["te"]
-
-    result_dict = {
-        "iv_effect_type_1": te1,
-        "iv_effect_type_2": te2,
-        "iv_effect_type_3": te3,
-        "iv_effect_type_1_plus_2": te1_2,
-        "iv_effect_type_1_plus_3": te1_3,
-    }
+def base_rate_neglect_chunks(user_types=None, random_seed=None, chunk_size=100_000):
+    """
+    the rows of simulate_iv_base_rate_neglect, drawn type by type
+    in dataframes of at most chunk_size rows
 
-    return [df, result_dict]
+    Args:
+      user_types, random_seed: see simulate_iv_base_rate_neglect
+      chunk_size: rows per chunk
+
+    Yields:
+      dataframes, the chunks of one type before those of the next
+    """
+    if user_types is None:
+        user_types = DEFAULT_USER_TYPES
+    rng = random_state(random_seed)
+    for k, user_type in enumerate(user_types):
+        for start in range(0, user_type["size"], chunk_size):
+            rows = min(chunk_size, user_type["size"] - start)
+            yield draw_users(user_types, np.full(rows, k), rng)
+
+
+def random_state(random_seed):
+    """
+    np.random (seeded when random_seed is not None), or random_seed
+    itself when it is a np.random.Generator
+    """
+    if isinstance(random_seed, np.random.Generator):
+        return random_seed
+    if random_seed is not None:
+        np.random.seed(random_seed)
+    return np.random
+
+
+def estimate_chunks(user_types, chunks):
+    """
+    the iv regressions of simulate_iv_base_rate_neglect on chunks,
+    keeping only the regression statistics
+
+    Returns:
+      the results dictionary of simulate_iv_base_rate_neglect
+    """
+    spec = {"t": "treatment", "X_exo": ["x2"], "X_end": "x", "y": "y", "iv": True}
+    accumulators = [TEAccumulator(**spec) for _ in user_types]
+    for chunk in chunks:
+        # the chunks hold a single type
+        accumulators[chunk["type"].iat[0] - 1].update(chunk)
+
+    result_dict = {}
+    for k, accumulator in enumerate(accumulators, start=1):
+        result_dict["iv_effect_type_{}".format(k)] = accumulator.result()["te"]
+    for k in range(2, len(user_types) + 1):
+        combined = TEAccumulator(**spec).merge(accumulators[0])
+        combined.merge(accumulators[k - 1])
+        result_dict["iv_effect_type_1_plus_{}".format(k)] = combined.result()["te"]
+    return result_dict
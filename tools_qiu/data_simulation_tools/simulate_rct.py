@@ -1,13 +1,27 @@
 import numpy as np
 import pandas as pd
+from ..data_prep import compact_columns
 
+DEFAULT_DATA_GENERATION_PARAMETERS = {
+    "sample_size": 2000,
+    "treatment_proportion": 0.3,
+    # coefficients ordering: intercept, treatment_effect, x1, x2, epsilon
+    "coefficients": np.array([0.1, 0.2, 0.3, -0.2, 1]),
+    "normal_mean": np.array([0, 0, 0]),
+    "normal_cov": np.array([[1, 0.7, -0.5], [0.7, 1, -0.4], [-0.5, -0.4, 1]]),
+}
 
-def simulate_rct(data_generation_parameters=None, random_seed=10086, log_normal=True):
+
+def simulate_rct(
+    data_generation_parameters=None, random_seed=10086, log_normal=True, compact=False
+):
     """
     simulate RCT data.
 
     Args:
         log_normal (bool): If True, applies exponential transformation to generated samples.
+        compact (bool): If True, drops the constant intercept column
+            and stores the treatment as int8 (the same values otherwise).
 
     Returns:
         pd.DataFrame: Simulated RCT data.
@@ -16,38 +30,63 @@ def simulate_rct(data_generation_parameters=None, random_seed=10086, log_normal=
         np.random.seed(random_seed)
 
     if data_generation_parameters is None:
-        data_generation_parameters = {
-            "sample_size": 2000,
-            "treatment_proportion": 0.3,
-            # coefficients ordering: intercept, treatment_effect, x1, x2, epsilon
-            "coefficients": np.array([0.1, 0.2, 0.3, -0.2, 1]),
-            "normal_mean": np.array([0, 0, 0]),
-            "normal_cov": np.array([[1, 0.7, -0.5], [0.7, 1, -0.4], [-0.5, -0.4, 1]]),
-        }
-
-    samples = np.random.multivariate_normal(
+        data_generation_parameters = DEFAULT_DATA_GENERATION_PARAMETERS
+
+    columns = generate_rct(
+        data_generation_parameters,
+        np.random,
+        data_generation_parameters["sample_size"],
+        log_normal,
+    )
+    if compact:
+        columns = compact_columns(columns)
+    df = pd.DataFrame(columns, copy=False)
+
+    df["obs_index"] = np.arange(1, data_generation_parameters["sample_size"] + 1)
+
+    return df
+
+
+def generate_rct(data_generation_parameters, rng, size, log_normal):
+    """
+    draw RCT columns.
+
+    Args:
+        data_generation_parameters (dict): See DEFAULT_DATA_GENERATION_PARAMETERS.
+        rng: np.random (the global state) or a np.random.Generator.
+        size (int): Number of rows to draw.
+        log_normal (bool): If True, applies exponential transformation to generated samples.
+
+    Returns:
+        dict: Column name to array.
+    """
+    samples = rng.multivariate_normal(
         data_generation_parameters["normal_mean"],
         data_generation_parameters["normal_cov"],
-        size=data_generation_parameters["sample_size"],
+        size=size,
     )
 
-    treatment_assignment = np.random.binomial(
+    treatment_assignment = rng.binomial(
         n=1,
         p=data_generation_parameters["treatment_proportion"],
-        size=data_generation_parameters["sample_size"],
+        size=size,
     )
 
-    df = pd.DataFrame(samples, columns=["x1", "x2", "epsilon"])
-
     if log_normal:
-        df = df.apply(lambda x: np.exp(x))
+        samples = np.exp(samples)
 
-    df["treatment"] = treatment_assignment
-    df["intercept"] = 1
-    df["y"] = df[["intercept", "treatment", "x1", "x2", "epsilon"]].dot(
-        data_generation_parameters["coefficients"]
+    intercept = np.ones(size, dtype=treatment_assignment.dtype)
+    # column-major like the values of a dataframe, so the dot is bitwise the same
+    design = np.asfortranarray(
+        np.column_stack([intercept, treatment_assignment, samples])
     )
+    y = design.dot(data_generation_parameters["coefficients"])
 
-    df["obs_index"] = np.arange(1, data_generation_parameters["sample_size"] + 1)
-
-    return df
+    return {
+        "x1": samples[:, 0],
+        "x2": samples[:, 1],
+        "epsilon": samples[:, 2],
+        "treatment": treatment_assignment,
+        "intercept": intercept,
+        "y": y,
+    }
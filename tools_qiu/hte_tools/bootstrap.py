@@ -0,0 +1,194 @@
+import numpy as np
+from ..te_tools.sufficient_stats import design_columns, drop_incomplete, solve_2sls
+
+# Poisson bootstrap for calculate_hte and evaluate_hte.
+# every replicate weighs each row by a Poisson(1) draw, the weighted
+# statistics of a batch of replicates come from one matrix product
+# (cross products) or one cumulative sum (lift curves) instead of refits.
+# replicates are drawn and solved in batches of at most max_elements
+# weights, so memory does not grow with n_boot
+
+
+def bootstrap_hte(
+    df,
+    t,
+    X_exo,
+    X_end,
+    y,
+    iv,
+    n_boot,
+    conf_level,
+    codes=None,
+    n_groups=1,
+    random_seed=None,
+    max_elements=2**22,
+):
+    """
+    percentile intervals of the treatment effect of every group and all rows
+
+    Args:
+      df, t, X_exo, X_end, y, iv: see calculate_te
+      n_boot: number of bootstrap replicates
+      conf_level: interval level
+      codes: group of each row (between 0 and n_groups - 1), None for one group
+      n_groups: number of groups
+      random_seed: seed or np.random.Generator of the Poisson weights
+      max_elements: weights drawn at once (bounds the memory)
+
+    Returns:
+      an array of [low, high] with shape (n_groups + 1, n_outcomes, 2),
+      the last group is all rows
+    """
+    cols, iz, ix, target = design_columns(df, t, X_exo, X_end, y, iv)
+    # rows with a missing value are dropped, as in calculate_te
+    cols, codes = drop_incomplete(cols, codes)
+    n = len(cols[0])
+    n_outcomes = len(y) if isinstance(y, list) else 1
+    # [intercept] + regressors and instruments, then the outcomes
+    cols = [np.ones(n)] + [np.asarray(col, np.float64) for col in cols]
+    m = len(cols) - n_outcomes
+    first, second = np.triu_indices(len(cols))
+
+    if codes is None:
+        codes = np.zeros(n, dtype=np.intp)
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    rng = np.random.default_rng(random_seed)
+
+    # a batch of replicates is accumulated and solved before the next one,
+    # max_elements bounds both its weights and its sums
+    block_rows = min(n, 2**16)
+    batch = max(
+        1, min(n_boot, max_elements // max(block_rows, n_groups * len(first), 1))
+    )
+    te = np.empty((n_boot, n_groups + 1, n_outcomes))
+    for b in range(0, n_boot, batch):
+        size = min(batch, n_boot - b)
+        # weighted sums of the column pair products per replicate and group
+        sums = np.zeros((size, n_groups, len(first)))
+        for start in range(0, n, block_rows):
+            rows = order[start : start + block_rows]
+            block = np.column_stack([cols[i][rows] for i in range(len(cols))])
+            products = block[:, first] * block[:, second]
+            weights = rng.poisson(1.0, (size, len(rows))).astype(np.float64)
+            # rows are sorted by group, so every group is one slice of the block
+            block_codes = sorted_codes[start : start + block_rows]
+            bounds = np.searchsorted(block_codes, np.arange(n_groups + 1))
+            for g in range(n_groups):
+                lo, hi = bounds[g], bounds[g + 1]
+                if hi > lo:
+                    sums[:, g] += weights[:, lo:hi] @ products[lo:hi]
+        sums = np.concatenate([sums, sums.sum(axis=1, keepdims=True)], axis=1)
+
+        M = np.empty(sums.shape[:2] + (len(cols), len(cols)))
+        M[..., first, second] = sums
+        M[..., second, first] = sums
+        M = M.reshape((-1,) + M.shape[2:])
+        zz = M[:, iz][:, :, iz]
+        zx = M[:, iz][:, :, ix]
+        zy = M[:, iz][:, :, m:]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            beta = solve_2sls(zz, zx, zy)[0]
+        te[b : b + size] = beta[:, target, :].reshape(size, n_groups + 1, n_outcomes)
+    return percentile_interval(te, conf_level)
+
+
+def bootstrap_lift(
+    treatment,
+    x,
+    y,
+    p_x,
+    n_boot,
+    conf_level,
+    approx_level,
+    start_point,
+    search_step,
+    exact,
+    random_seed=None,
+    max_elements=2**22,
+):
+    """
+    percentile intervals of p_y and p_users of evaluate_hte,
+    the cutoff is searched again on the lift curve of every replicate
+
+    Args:
+      treatment, x, y: arrays in ranking order
+      p_x, approx_level, start_point, search_step, exact: see evaluate_hte
+      n_boot: number of bootstrap replicates
+      conf_level: interval level
+      random_seed: seed or np.random.Generator of the Poisson weights
+      max_elements: weights drawn at once (bounds the memory)
+
+    Returns:
+      a list of [low, high] intervals for p_y and p_users
+    """
+    n = len(treatment)
+    is_t = treatment == 1
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    if exact:
+        candidates = np.arange(start_point, n)
+    else:
+        candidates = np.arange(start_point, n, search_step)
+    rng = np.random.default_rng(random_seed)
+
+    batch = max(1, min(n_boot, max_elements // max(n, 1)))
+    p_y = np.empty(n_boot)
+    p_users = np.empty(n_boot)
+    for b in range(0, n_boot, batch):
+        size = min(batch, n_boot - b)
+        weights = rng.poisson(1.0, (size, n)).astype(np.float64)
+        n_all = np.cumsum(weights, axis=1)
+        weights_t = np.where(is_t, weights, 0)
+        lift_x, lift_y = weighted_lift_curves(weights, weights_t, n_all, x, y)
+
+        share_x = lift_x[:, candidates] / lift_x[:, -1:]
+        if exact:
+            hit = share_x >= p_x / 100
+        else:
+            hit = np.abs(share_x - p_x / 100) <= approx_level
+        # like find_cutoff, fall back to the last candidate
+        i = np.where(
+            hit.any(axis=1), candidates[np.argmax(hit, axis=1)], candidates[-1]
+        )
+        replicates = np.arange(size)
+        p_y[b : b + size] = 100 * lift_y[replicates, i] / lift_y[:, -1]
+        included = n_all[replicates, i] - weights[replicates, i]
+        p_users[b : b + size] = 100 * included / n_all[:, -1]
+
+    return [
+        percentile_interval(p_y, conf_level),
+        percentile_interval(p_users, conf_level),
+    ]
+
+
+def weighted_lift_curves(weights, weights_t, n_all, *targets):
+    """
+    calculate_lift_curve of every replicate (one row of weights each)
+    """
+    n_t = np.cumsum(weights_t, axis=1)
+    n_c = n_all - n_t
+    curves = []
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for target in targets:
+            # as in calculate_lift_curve, the means skip missing values
+            valid_t, valid_c = n_t, n_c
+            missing = np.isnan(target)
+            if missing.any():
+                target = np.where(missing, 0, target)
+                valid_t = np.cumsum(np.where(missing, 0, weights_t), axis=1)
+                valid_c = np.cumsum(np.where(missing, 0, weights), axis=1) - valid_t
+            sum_t = np.cumsum(weights_t * target, axis=1)
+            sum_c = np.cumsum(weights * target, axis=1) - sum_t
+            curves.append((sum_t / valid_t - sum_c / valid_c) * n_c)
+    return curves
+
+
+def percentile_interval(replicates, conf_level):
+    """
+    [low, high] percentiles over the first axis
+    (replicates with a singular design are ignored)
+    """
+    alpha = (1 - conf_level) / 2
+    bounds = np.nanquantile(replicates, [alpha, 1 - alpha], axis=0)
+    return np.moveaxis(bounds, 0, -1)
@@ -1,94 +1,193 @@
 import pandas as pd
 import numpy as np
+from ..data_prep import as_pandas, category_codes, regression_columns
+from ..profiling import profiled, stage
 from ..te_tools.calculate_te import calculate_te
+from ..te_tools.sufficient_stats import estimate_groups
+from .bootstrap import bootstrap_hte
+from .parallel_subsets import fit_subsets
 
+# key of the overall row in add_bootstrap_intervals, never equal to a subset name
+_ALL = object()
 
+
+@profiled
 def calculate_hte(
-    df, criterion, is_cat, n_bins, t, X_exo, X_end, y, iv, conf_level=0.95
+    df,
+    criterion,
+    is_cat,
+    n_bins,
+    t,
+    X_exo,
+    X_end,
+    y,
+    iv,
+    conf_level=0.95,
+    engine="linearmodels",
+    n_jobs=1,
+    executor="process",
+    cache=None,
+    n_boot=0,
+    random_seed=None,
+    float32=False,
 ):
     """
     calculate treatment effects for subsets based on a selection criteria
     treatment effect using the entire df is also calculated for reference
 
     Args:
-      df: data
-      criterion: the column used for selecting subsets
+      df: data (a pandas DataFrame, an Arrow table or a Polars DataFrame)
+      criterion: the column used for selecting subsets,
+        or a list of columns for the cross-product of their bins
+        (e.g. two scores with n_bins=5 give a 5x5 grid)
       is_cat: indicate whether the criterion is categorical
-      n_bins: split the df equally by n_bins
+        (a list with one flag per criterion for a list of criteria)
+      n_bins: split the df equally by n_bins, quantile bins are half-open,
+        so every row is in exactly one bin
+        (a list with one number per criterion for a list of criteria)
       t: treatment variable (also the instrument variable)
       X_exo: exogenous covariate variables
       X_end: single endogenous variable
-      y: outcome variable
+      y: outcome variable, or a list of outcome variables
+        (one row per subset and outcome)
       iv: whether it is iv regression
       conf_level: confidence interval level
+      engine: "linearmodels" fits calculate_te on each subset,
+        "numpy" estimates all subsets in a single pass over the data
+      n_jobs: number of workers fitting the subsets with engine="linearmodels"
+        (1 runs serially, -1 uses all cores)
+      executor: "process", "thread" or a concurrent.futures executor
+      cache: optional ResultCache, repeated calls on unchanged data
+        return the stored result (not used for a bootstrap without random_seed)
+      n_boot: number of Poisson bootstrap replicates, adds percentile
+        intervals te_boot_low and te_boot_high at conf_level
+        (0 keeps the analytic intervals only)
+      random_seed: seed of the bootstrap weights
+      float32: with engine="numpy", read the covariates and outcomes as
+        float32 (the products lose precision, sums are kept in float64);
+        float32 columns are then read without a copy, float64 columns
+        are copied, so it only saves memory on float32 data
 
     Returns:
       a dataframe with estimates
     """
+    criteria = criterion if isinstance(criterion, list) else [criterion]
+    columns = criteria + regression_columns(t, X_exo, X_end, y, iv)
+    df = as_pandas(df, columns)
+    # an unseeded bootstrap gives different intervals on every call,
+    # so it is not cached
+    if cache is not None and (n_boot == 0 or random_seed is not None):
+        spec = (
+            "calculate_hte",
+            criterion,
+            is_cat,
+            n_bins,
+            t,
+            X_exo,
+            X_end,
+            y,
+            iv,
+            conf_level,
+            engine,
+            n_boot,
+            random_seed,
+            float32,
+        )
+        return cache.get_or_compute(
+            df,
+            columns,
+            spec,
+            lambda: calculate_hte(
+                df,
+                criterion,
+                is_cat,
+                n_bins,
+                t,
+                X_exo,
+                X_end,
+                y,
+                iv,
+                conf_level,
+                engine,
+                n_jobs,
+                executor,
+                n_boot=n_boot,
+                random_seed=random_seed,
+                float32=float32,
+            ),
+        )
+    if n_boot > 0:
+        results_df = calculate_hte(
+            df,
+            criterion,
+            is_cat,
+            n_bins,
+            t,
+            X_exo,
+            X_end,
+            y,
+            iv,
+            conf_level,
+            engine,
+            n_jobs,
+            executor,
+            float32=float32,
+        )
+        return add_bootstrap_intervals(
+            results_df,
+            df,
+            criterion,
+            is_cat,
+            n_bins,
+            t,
+            X_exo,
+            X_end,
+            y,
+            iv,
+            conf_level,
+            n_boot,
+            random_seed,
+        )
+    if engine == "numpy":
+        return calculate_hte_single_pass(
+            df, criterion, is_cat, n_bins, t, X_exo, X_end, y, iv, conf_level, float32
+        )
+    if float32:
+        raise ValueError("float32 needs engine='numpy'")
+    if n_jobs != 1:
+        return calculate_hte_parallel(
+            df,
+            criterion,
+            is_cat,
+            n_bins,
+            t,
+            X_exo,
+            X_end,
+            y,
+            iv,
+            conf_level,
+            engine,
+            n_jobs,
+            executor,
+        )
 
-    results_df = pd.DataFrame()
-
-    if is_cat:
-        unique_values = df[criterion].unique()
-
-        for value in unique_values:
-            subset = df[df[criterion] == value]
-            result_row = pd.DataFrame.from_records(
-                [
-                    calculate_te(
-                        df=subset,
-                        t=t,
-                        X_exo=X_exo,
-                        X_end=X_end,
-                        y=y,
-                        iv=iv,
-                        conf_level=conf_level,
-                    )
-                ]
-            )
-            result_row["subset_name"] = value
-            results_df = pd.concat([results_df, result_row], ignore_index=True)
-
-    else:
-        quantile_boundaries = np.linspace(0, 1, n_bins + 1)
-        quantiles = df[criterion].quantile(quantile_boundaries)
-
-        for i in range(n_bins):
-            lower_bound = quantiles.iloc[i]
-            upper_bound = quantiles.iloc[i + 1]
-            subset = df.loc[
-                (df[criterion] >= lower_bound) & (df[criterion] <= upper_bound)
-            ]
+    # subsets copy only the columns used by the regressions
+    df = df[list(dict.fromkeys(columns))]
 
-            if subset.shape[0] == 0:
-                print(
-                    f"Warning: No data points found in quantile range {lower_bound:.2f} - {upper_bound:.2f}"
-                )
-            else:
-                result_row = pd.DataFrame.from_records(
-                    [
-                        calculate_te(
-                            df=subset,
-                            t=t,
-                            X_exo=X_exo,
-                            X_end=X_end,
-                            y=y,
-                            iv=iv,
-                            conf_level=conf_level,
-                        )
-                    ]
-                )
-
-                result_row["subset_name"] = (
-                    str(int(round(((i + 1) / n_bins) * 100))) + "%"
-                )
-                results_df = pd.concat([results_df, result_row], ignore_index=True)
+    with stage("binning", df.shape[0]):
+        codes, subset_names, descriptions = subset_codes(df, criterion, is_cat, n_bins)
+        subsets = split_codes(codes, len(subset_names))
 
-    # add estimates from the entire data for reference
-    result_row = pd.DataFrame.from_records(
-        [
+    results_df = pd.DataFrame()
+    for rows, subset_name, description in zip(subsets, subset_names, descriptions):
+        if len(rows) == 0:
+            print(f"Warning: No data points found in {description}")
+            continue
+        with stage("subset selection"):
+            subset = df.iloc[rows]
+        result_row = as_frame(
             calculate_te(
-                df=df,
+                df=subset,
                 t=t,
                 X_exo=X_exo,
                 X_end=X_end,
@@ -96,9 +195,254 @@ def calculate_hte(
                 iv=iv,
                 conf_level=conf_level,
             )
-        ]
+        )
+        result_row["subset_name"] = subset_name
+        results_df = pd.concat([results_df, result_row], ignore_index=True)
+
+    # add estimates from the entire data for reference
+    result_row = as_frame(
+        calculate_te(
+            df=df,
+            t=t,
+            X_exo=X_exo,
+            X_end=X_end,
+            y=y,
+            iv=iv,
+            conf_level=conf_level,
+        )
     )
     result_row["subset_name"] = "all"
     results_df = pd.concat([results_df, result_row], ignore_index=True)
 
     return results_df
+
+
+def calculate_hte_single_pass(
+    df, criterion, is_cat, n_bins, t, X_exo, X_end, y, iv, conf_level, float32=False
+):
+    """
+    calculate_hte with engine="numpy":
+    per subset sufficient statistics are accumulated over group codes,
+    and the "all" row is solved from their sum instead of refitting
+    """
+    with stage("binning", df.shape[0]):
+        codes, subset_names, descriptions = subset_codes(df, criterion, is_cat, n_bins)
+
+    # rows outside of all subsets go to an extra group,
+    # they are only used for the "all" row
+    n_groups = len(subset_names)
+    codes = np.where(codes < 0, n_groups, codes)
+    group_results, all_result = estimate_groups(
+        df,
+        t,
+        X_exo,
+        X_end,
+        y,
+        iv,
+        conf_level,
+        codes=codes,
+        n_groups=n_groups + 1,
+        float32=float32,
+    )
+
+    if not isinstance(y, list):
+        group_results = [[result] for result in group_results]
+        all_result = [all_result]
+
+    with stage("result assembly"):
+        records = []
+        for i, results in enumerate(group_results[:n_groups]):
+            if results[0]["data_size"] > 0:
+                records += [
+                    {**result, "subset_name": subset_names[i]} for result in results
+                ]
+            else:
+                print(f"Warning: No data points found in {descriptions[i]}")
+        records += [{**result, "subset_name": "all"} for result in all_result]
+
+        return pd.DataFrame.from_records(records)
+
+
+def calculate_hte_parallel(
+    df,
+    criterion,
+    is_cat,
+    n_bins,
+    t,
+    X_exo,
+    X_end,
+    y,
+    iv,
+    conf_level,
+    engine,
+    n_jobs,
+    executor,
+):
+    """
+    calculate_hte with n_jobs != 1:
+    the same subsets as the serial loop are fitted by a pool of workers,
+    results come back in the serial order
+    """
+    with stage("binning", df.shape[0]):
+        codes, names, descriptions = subset_codes(df, criterion, is_cat, n_bins)
+        subsets = []
+        subset_names = []
+        for rows, name, description in zip(
+            split_codes(codes, len(names)), names, descriptions
+        ):
+            if len(rows) == 0:
+                print(f"Warning: No data points found in {description}")
+            else:
+                subsets.append(rows)
+                subset_names.append(name)
+
+    # add estimates from the entire data for reference
+    subsets.append(None)
+    subset_names.append("all")
+
+    columns = regression_columns(t, X_exo, X_end, y, iv)
+    fit_kwargs = {
+        "t": t,
+        "X_exo": X_exo,
+        "X_end": X_end,
+        "y": y,
+        "iv": iv,
+        "conf_level": conf_level,
+        "engine": engine,
+    }
+    with stage("parallel fits", df.shape[0]):
+        results = fit_subsets(df, columns, subsets, fit_kwargs, n_jobs, executor)
+
+    return pd.concat(
+        [
+            as_frame(result).assign(subset_name=subset_name)
+            for result, subset_name in zip(results, subset_names)
+        ],
+        ignore_index=True,
+    )
+
+
+def add_bootstrap_intervals(
+    results_df,
+    df,
+    criterion,
+    is_cat,
+    n_bins,
+    t,
+    X_exo,
+    X_end,
+    y,
+    iv,
+    conf_level,
+    n_boot,
+    random_seed,
+):
+    """
+    te_boot_low and te_boot_high columns for the rows of calculate_hte,
+    all subsets share the weights of each replicate
+    """
+    with stage("binning", df.shape[0]):
+        codes, subset_names, _ = subset_codes(df, criterion, is_cat, n_bins)
+        n_groups = len(subset_names)
+        codes = np.where(codes < 0, n_groups, codes)
+    with stage("bootstrap", df.shape[0]):
+        intervals = bootstrap_hte(
+            df,
+            t,
+            X_exo,
+            X_end,
+            y,
+            iv,
+            n_boot,
+            conf_level,
+            codes,
+            n_groups + 1,
+            random_seed,
+        )
+
+    # the extra group of rows without a subset is not reported.
+    # the last rows of results_df are the "all" rows, they are matched by
+    # position, so a category named "all" keeps its own interval
+    outcomes = y if isinstance(y, list) else [y]
+    lookup = {}
+    for g, name in enumerate(subset_names + [_ALL]):
+        interval = intervals[g if g < n_groups else -1]
+        for j, outcome in enumerate(outcomes):
+            lookup[(name, outcome)] = interval[j]
+    names = list(results_df["subset_name"])
+    names[len(names) - len(outcomes) :] = [_ALL] * len(outcomes)
+    bounds = np.array(
+        [lookup[(name, outcome)] for name, outcome in zip(names, results_df["y"])]
+    ).reshape(-1, 2)
+    results_df["te_boot_low"] = bounds[:, 0]
+    results_df["te_boot_high"] = bounds[:, 1]
+    return results_df
+
+
+def subset_codes(df, criterion, is_cat, n_bins):
+    """
+    subset code of every row, computed once for all subsets
+    (-1 for rows without a subset, e.g. missing criterion values)
+
+    continuous criteria are cut at their quantiles with np.searchsorted into
+    half-open bins [q_i, q_i+1) (the last bin also holds the maximum),
+    several criteria give the cross-product of their bins
+
+    Returns:
+      a list [codes, subset names, descriptions for warnings]
+    """
+    criteria = criterion if isinstance(criterion, list) else [criterion]
+    flags = is_cat if isinstance(is_cat, list) else [is_cat] * len(criteria)
+    bins = n_bins if isinstance(n_bins, list) else [n_bins] * len(criteria)
+
+    codes = None
+    for name, cat, n in zip(criteria, flags, bins):
+        if cat:
+            column_codes, labels = category_codes(df[name])
+            descriptions = ["subset {}".format(label) for label in labels]
+        else:
+            quantile_boundaries = np.linspace(0, 1, n + 1)
+            quantiles = df[name].quantile(quantile_boundaries).to_numpy()
+            values = df[name].to_numpy(dtype=np.float64)
+            column_codes = np.searchsorted(quantiles[1:-1], values, side="right")
+            column_codes[np.isnan(values)] = -1
+            labels = [str(int(round(((i + 1) / n) * 100))) + "%" for i in range(n)]
+            descriptions = [
+                f"quantile range {quantiles[i]:.2f} - {quantiles[i + 1]:.2f}"
+                for i in range(n)
+            ]
+
+        if codes is None:
+            codes, subset_names = column_codes, labels
+            continue
+        # mixed radix: the code of the earlier criteria, then this one
+        codes = np.where(
+            (codes < 0) | (column_codes < 0), -1, codes * len(labels) + column_codes
+        )
+        subset_names = [
+            "{} & {}".format(first, second)
+            for first in subset_names
+            for second in labels
+        ]
+        descriptions = ["subset {}".format(name) for name in subset_names]
+    return [codes, subset_names, descriptions]
+
+
+def split_codes(codes, n_subsets):
+    """
+    row positions of every subset code, from one stable sort
+    (rows keep their original order within a subset)
+    """
+    order = np.argsort(codes, kind="stable")
+    counts = np.bincount(codes[codes >= 0], minlength=n_subsets)
+    return np.split(order[len(order) - counts.sum() :], np.cumsum(counts)[:-1])
+
+
+def as_frame(result):
+    """
+    calculate_te output as rows
+    (a dictionary for one outcome, a dataframe for a list of outcomes)
+    """
+    if isinstance(result, pd.DataFrame):
+        return result
+    return pd.DataFrame.from_records([result])
@@ -1,5 +1,26 @@
+import numpy as np
+import pandas as pd
+from ..data_prep import as_pandas, treatment_array
+from ..profiling import profiled, stage
+from .bootstrap import bootstrap_lift
+
+
+@profiled
 def evaluate_hte(
-    df, criterion, p_x, y, x, t, approx_level=None, start_point=None, search_step=None
+    df,
+    criterion,
+    p_x,
+    y,
+    x,
+    t,
+    approx_level=None,
+    start_point=None,
+    search_step=None,
+    exact=False,
+    return_curve=False,
+    n_boot=0,
+    conf_level=0.95,
+    random_seed=None,
 ):
     """
 
@@ -11,19 +32,27 @@ def evaluate_hte(
 
 
     Args:
-      df: data
+      df: data (a pandas DataFrame, an Arrow table or a Polars DataFrame)
       criterion: the column used for ranking
       p_x: p_x% reduction in x (between 0-100)
       y: the outcome metric
       x: often an endogenous variable instrumented by t
       t: the binary treatment variable
       approx_level: the approximation error level
+      exact: ignore approx_level and search_step,
+        the cutoff is the first row (from start_point) reaching p_x
+      return_curve: also return the (p_users, p_x, p_y) curve for every cutoff
+      n_boot: number of Poisson bootstrap replicates, adds percentile
+        intervals p_y_low, p_y_high, p_users_low and p_users_high
+      conf_level: level of the bootstrap intervals
+      random_seed: seed of the bootstrap weights
 
     Returns:
       a cutoff value for the criterion and
       the contribution to the total lift in y (in percent)
       share of users included
     """
+    df = as_pandas(df, [criterion, t, x, y])
     if approx_level is None:
         # tolerate 0.01 approximation error
         approx_level = 0.01
@@ -34,27 +63,25 @@ def evaluate_hte(
         # increase the search_step to decrease searching time
         search_step = max(1, int(df.shape[0] / 10000))
 
-    df = df.sort_values(by=criterion, ascending=False).reset_index(drop=True)
-
-    def calculate_lift(index_cutoff, target):
-        df_temp = df.loc[df.index <= index_cutoff]
-        n_c = df_temp.groupby(t)[t].count().sort_index(ascending=True)[0]
-        target_avg_c, target_avg_t = (
-            df_temp.groupby(t)[target].mean().sort_index(ascending=True)
+    # sort once, the lift of every cutoff comes from cumulative sums
+    rows = df.shape[0]
+    with stage("sort", rows):
+        values = df[criterion].to_numpy()
+        order = ranking_order(values)
+    with stage("lift curve", rows):
+        lift_x, lift_y = calculate_lift_curve(
+            treatment_array(df[t])[order],
+            df[x].to_numpy()[order],
+            df[y].to_numpy()[order],
         )
-        total_lift = (target_avg_t - target_avg_c) * n_c
-        return total_lift
+        share_x = lift_x / lift_x[-1]
 
-    total_lift_x_all = calculate_lift(df.shape[0], x)
-    total_lift_y_all = calculate_lift(df.shape[0], y)
+    with stage("cutoff search", rows):
+        i = find_cutoff(share_x, p_x, approx_level, start_point, search_step, exact)
 
-    for i in range(start_point, df.shape[0], search_step):
-        if abs(calculate_lift(i, x) / total_lift_x_all - p_x / 100) <= approx_level:
-            break
-
-    p_y = 100 * (calculate_lift(i, y) / total_lift_y_all)
+    p_y = 100 * (lift_y[i] / lift_y[-1])
     p_users = 100 * i / df.shape[0]
-    criterion_cutoff = df.loc[df.index == i, criterion].values[0]
+    criterion_cutoff = values[order[i]]
 
     result_dict = {
         "p_x": p_x,
@@ -64,4 +91,90 @@ def evaluate_hte(
         "criterion_name": criterion,
     }
 
+    if n_boot > 0:
+        with stage("bootstrap", rows):
+            p_y_interval, p_users_interval = bootstrap_lift(
+                treatment_array(df[t])[order],
+                df[x].to_numpy()[order],
+                df[y].to_numpy()[order],
+                p_x,
+                n_boot,
+                conf_level,
+                approx_level,
+                start_point,
+                search_step,
+                exact,
+                random_seed,
+            )
+        result_dict["p_y_low"], result_dict["p_y_high"] = p_y_interval
+        result_dict["p_users_low"], result_dict["p_users_high"] = p_users_interval
+
+    if return_curve:
+        with stage("curve", rows):
+            result_dict["curve"] = pd.DataFrame(
+                {
+                    "p_users": 100 * np.arange(df.shape[0]) / df.shape[0],
+                    "p_x": 100 * share_x,
+                    "p_y": 100 * lift_y / lift_y[-1],
+                    "criterion_cutoff": values[order],
+                }
+            )
+
     return result_dict
+
+
+def ranking_order(values):
+    """
+    positions of the rows from the highest to the lowest value
+    (ties keep the data order, missing values go last)
+    """
+    return np.argsort(-values.astype(np.float64), kind="stable")
+
+
+def calculate_lift_curve(treatment, *targets):
+    """
+    total lift of each target when the first i + 1 rows are included,
+    (avg_t - avg_c) * n_c, for every i in one pass
+    (the averages skip missing values)
+
+    Args:
+      treatment: binary treatment in ranking order
+      targets: target arrays in ranking order
+
+    Returns:
+      a list of lift arrays, the last element is the lift of all rows
+    """
+    is_t = treatment == 1
+    n_t = np.cumsum(is_t)
+    n_c = np.arange(1, len(is_t) + 1) - n_t
+    curves = []
+    # cutoffs without both groups have no lift
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for target in targets:
+            target = target.astype(np.float64)
+            # the means skip missing values (like groupby().mean()),
+            # n_c still counts every control row
+            valid_t, valid_c = n_t, n_c
+            missing = np.isnan(target)
+            if missing.any():
+                target = np.where(missing, 0, target)
+                valid_t = np.cumsum(is_t & ~missing)
+                valid_c = np.cumsum(~is_t & ~missing)
+            sum_t = np.cumsum(np.where(is_t, target, 0))
+            sum_c = np.cumsum(np.where(is_t, 0, target))
+            curves.append((sum_t / valid_t - sum_c / valid_c) * n_c)
+    return curves
+
+
+def find_cutoff(share_x, p_x, approx_level, start_point, search_step, exact):
+    """
+    position of the cutoff row on the share_x curve
+    """
+    if exact:
+        candidates = np.arange(start_point, len(share_x))
+        hit = share_x[candidates] >= p_x / 100
+    else:
+        candidates = np.arange(start_point, len(share_x), search_step)
+        hit = np.abs(share_x[candidates] - p_x / 100) <= approx_level
+    # like the linear scan, fall back to the last candidate
+    return int(candidates[np.argmax(hit)] if hit.any() else candidates[-1])
@@ -0,0 +1,66 @@
+import pandas as pd
+from ..data_prep import as_pandas, treatment_array
+from .evaluate_hte import calculate_lift_curve, find_cutoff, ranking_order
+
+
+def evaluate_hte_batch(
+    df,
+    criteria,
+    p_x_list,
+    y,
+    x,
+    t,
+    approx_level=None,
+    start_point=None,
+    search_step=None,
+    exact=False,
+):
+    """
+    evaluate_hte for many ranking criteria and p_x values at once:
+    each criterion is ranked once with argsort (the df is not copied)
+    and every p_x is read off its lift curve,
+    with the same helpers as evaluate_hte
+
+    Args:
+      df: data (a pandas DataFrame, an Arrow table or a Polars DataFrame)
+      criteria: the columns used for ranking
+      p_x_list: p_x values (between 0-100)
+      y, x, t, approx_level, start_point, search_step, exact: see evaluate_hte
+
+    Returns:
+      a dataframe with one row per criterion and p_x
+    """
+    df = as_pandas(df, list(criteria) + [t, x, y])
+    if approx_level is None:
+        approx_level = 0.01
+    if start_point is None:
+        start_point = int(df.shape[0] * 1 / 100)
+    if search_step is None:
+        search_step = max(1, int(df.shape[0] / 10000))
+
+    treatment = treatment_array(df[t])
+    x_values = df[x].to_numpy()
+    y_values = df[y].to_numpy()
+
+    records = []
+    for criterion in criteria:
+        values = df[criterion].to_numpy()
+        order = ranking_order(values)
+        lift_x, lift_y = calculate_lift_curve(
+            treatment[order], x_values[order], y_values[order]
+        )
+        # the last point of the curve is the total lift, as in evaluate_hte
+        share_x = lift_x / lift_x[-1]
+        for p_x in p_x_list:
+            i = find_cutoff(share_x, p_x, approx_level, start_point, search_step, exact)
+            records.append(
+                {
+                    "p_x": p_x,
+                    "p_y": 100 * (lift_y[i] / lift_y[-1]),
+                    "p_users": 100 * i / df.shape[0],
+                    "criterion_cutoff": values[order[i]],
+                    "criterion_name": criterion,
+                }
+            )
+
+    return pd.DataFrame.from_records(records)
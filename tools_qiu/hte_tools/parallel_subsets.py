@@ -0,0 +1,107 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from ..te_tools.calculate_te import calculate_te
+
+# fit calculate_te on many subsets with a thread or process pool.
+# the needed numeric columns and the row positions of all subsets are put in
+# shared memory once, each task only carries a (start, stop) slice
+# (None for all rows), so no dataframe is pickled.
+# other columns (strings, categories) cannot live in shared memory
+# and are pickled with the tasks
+
+
+def fit_subsets(df, columns, subsets, fit_kwargs, n_jobs=-1, executor="process"):
+    """
+    calculate_te on each subset in parallel
+
+    Args:
+      df: data
+      columns: the columns needed by calculate_te
+      subsets: list of row positions for each subset (None for all rows)
+      fit_kwargs: the other arguments of calculate_te
+      n_jobs: number of workers (-1 for all cores)
+      executor: "process", "thread" or a concurrent.futures executor
+
+    Returns:
+      a list of calculate_te dictionaries in the order of subsets
+    """
+    arrays = {col: df[col].to_numpy() for col in columns}
+    # "all rows" is a flag, not a copy of every row position
+    parts = [np.asarray(rows, dtype=np.intp) for rows in subsets if rows is not None]
+    arrays["__index__"] = np.concatenate(parts) if parts else np.empty(0, np.intp)
+    starts, stops, stop = [], [], 0
+    for rows in subsets:
+        start = None if rows is None else stop
+        stop = stop if rows is None else stop + len(rows)
+        starts.append(start)
+        stops.append(None if rows is None else stop)
+
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    if executor in ("process", "thread"):
+        pool_class = (
+            ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+        )
+        pool = pool_class(max_workers=n_jobs)
+    else:
+        pool = executor
+
+    blocks = []
+    try:
+        if isinstance(pool, ThreadPoolExecutor):
+            shared = arrays
+        else:
+            shared = {}
+            for name, array in arrays.items():
+                if array.dtype.kind not in "biufcmM":
+                    shared[name] = array
+                    continue
+                block = shared_memory.SharedMemory(
+                    create=True, size=max(array.nbytes, 1)
+                )
+                blocks.append(block)
+                np.ndarray(array.shape, array.dtype, buffer=block.buf)[:] = array
+                shared[name] = (block.name, array.dtype.str, array.shape)
+        results = list(
+            pool.map(
+                _fit_subset,
+                [shared] * len(subsets),
+                starts,
+                stops,
+                [fit_kwargs] * len(subsets),
+            )
+        )
+    finally:
+        if pool is not executor:
+            pool.shutdown()
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    return results
+
+
+def _fit_subset(shared, start, stop, fit_kwargs):
+    blocks = []
+    arrays = {}
+    for name, value in shared.items():
+        if isinstance(value, np.ndarray):
+            arrays[name] = value
+        else:
+            block = shared_memory.SharedMemory(name=value[0])
+            blocks.append(block)
+            arrays[name] = np.ndarray(value[2], np.dtype(value[1]), buffer=block.buf)
+    try:
+        index = arrays.pop("__index__")
+        rows = slice(None) if start is None else index[start:stop]
+        subset = pd.DataFrame({name: array[rows] for name, array in arrays.items()})
+    finally:
+        # views must be released before the blocks can be closed
+        arrays = index = rows = None
+        for block in blocks:
+            block.close()
+    return calculate_te(df=subset, **fit_kwargs)
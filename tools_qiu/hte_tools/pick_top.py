@@ -1,4 +1,8 @@
-def pick_top(df, criterion, top_p, subset=False):
+import numpy as np
+import pandas as pd
+
+
+def pick_top(df, criterion, top_p, subset=False, as_bool=False):
     """
     pick the top_p share of the data
     (with ties, obtain less data)
@@ -7,20 +11,38 @@ def pick_top(df, criterion, top_p, subset=False):
     Args:
       df: data
       criterion: the column used for ranking
-      top_p: between 0-100
+      top_p: between 0-100, or a list of shares
+        (one top_<criterion>_<top_p> column or subset per share)
       subset: whether return a subset and keep the original df
+      as_bool: write a boolean column instead of the "top x%"/"rest" labels
 
     Returns:
       df with the addtional column indicating top or not
+      (a categorical column, so the labels are stored once)
       or a subset with the top data
     """
+    values = df[criterion].to_numpy(dtype=np.float64)
+    shares = top_p if isinstance(top_p, (list, tuple)) else [top_p]
+
+    # np.quantile only partially sorts around the requested ranks
+    # (the same thresholds as df[criterion].quantile)
+    thresholds = np.quantile(values[~np.isnan(values)], 1 - np.array(shares) / 100)
+
+    outputs = []
+    for share, threshold in zip(shares, thresholds):
+        is_top = values > threshold
+        if subset:
+            outputs.append(df.loc[is_top])
+            continue
+        col_name = "top_" + criterion
+        if shares is top_p:
+            col_name = "{}_{}".format(col_name, share)
+        if as_bool:
+            df[col_name] = is_top
+        else:
+            df[col_name] = pd.Categorical.from_codes(
+                is_top.astype(np.int8), categories=["rest", "top {}%".format(share)]
+            )
 
-    threshold = df[criterion].quantile(1 - top_p / 100)
-    col_name = "top_" + criterion
     if subset:
-        df_subset = df.loc[df[criterion] > threshold]
-        return df_subset
-    else:
-        df[col_name] = df[criterion].apply(
-            lambda x: "top {}%".format(top_p) if x > threshold else "rest"
-        )
+        return outputs if shares is top_p else outputs[0]
@@ -1,4 +1,8 @@
-import matplotlib.pyplot as plt
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 
 
 def plot_hte(
@@ -23,18 +27,43 @@ def plot_hte(
     Returns:
       None
     """
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=fig_size, dpi=dpi)
+    draw_hte(ax, df, show_size, percent, criterion)
+
+    # add optional note for convenience
+    ax.text(0.5, -0.2, note, transform=ax.transAxes, ha="center")
+
+    # save the plot if needed
+    if save_path:
+        plt.savefig(save_path, bbox_inches="tight", dpi=dpi)
+
+    # show the plot
+    plt.tight_layout()
+    plt.show()
+
+
+def draw_hte(ax, df, show_size=True, percent=False, criterion=" ", title=None):
+    """
+    draw the hte of all subsets on an axes
+
+    Args:
+      ax: matplotlib axes
+      df, show_size, percent, criterion: see plot_hte
+      title: axes title (by default a sentence with the outcome and criterion)
+    """
     subset_name = df["subset_name"]
-    data_size = df["data_size"]
-    te = df["te"]
-    te_low = df["te_low"]
-    te_high = df["te_high"]
+    data_size = df["data_size"].to_numpy()
+    te = df["te"].to_numpy(dtype=np.float64)
+    te_low = df["te_low"].to_numpy(dtype=np.float64)
+    te_high = df["te_high"].to_numpy(dtype=np.float64)
 
     if percent:
-        te = 100 * te / df["y_c"]
-        te_low = 100 * te_low / df["y_c"]
-        te_high = 100 * te_high / df["y_c"]
-
-    fig, ax = plt.subplots(figsize=fig_size, dpi=dpi)
+        y_c = df["y_c"].to_numpy(dtype=np.float64)
+        te = 100 * te / y_c
+        te_low = 100 * te_low / y_c
+        te_high = 100 * te_high / y_c
 
     # plot the error bars
     ax.errorbar(
@@ -49,19 +78,16 @@ def plot_hte(
         ecolor="black",
     )
 
-    ax.set_xticks(range(len(subset_name)))
-    ax.set_xticklabels(subset_name, rotation=45, ha="right")
-
+    labels = [str(name) for name in subset_name]
     if show_size:
-        # plot the data_size text close to each error bar
-        for i, size in enumerate(data_size):
-            ax.text(
-                i,
-                te[i] + (te_high[i] - te_low[i]) * 0.05,
-                f"n={round(size/1000,2)}k",
-                ha="center",
-                va="bottom",
-            )
+        # the data_size of each subset goes under its name,
+        # one tick label per subset instead of one text artist per point
+        labels = [
+            f"{label}\nn={round(size/1000,2)}k"
+            for label, size in zip(labels, data_size)
+        ]
+    ax.set_xticks(range(len(subset_name)))
+    ax.set_xticklabels(labels, rotation=45, ha="right")
 
     # add labels and title
     ax.set_xlabel("Subset Name")
@@ -70,28 +96,127 @@ def plot_hte(
     else:
         ax.set_ylabel("Treatment Effect")
 
-    if df["iv"][0]:
-        ax.set_title(
-            "Treatment Effect of {} on {} by Selected Subsets with Criterion ".format(
-                df["end"][0], df["y"][0]
+    if title is None:
+        if df["iv"].iloc[0]:
+            title = "Treatment Effect of {} on {} by Selected Subsets with Criterion ".format(
+                df["end"].iloc[0], df["y"].iloc[0]
             )
-            + criterion
-        )
+        else:
+            title = "Treatment Effect on {} by Selected Subsets with Criterion ".format(
+                df["y"].iloc[0]
+            )
+        title += criterion
+    ax.set_title(title)
+
+
+def plot_hte_batch(
+    results,
+    save_path,
+    layout="grid",
+    ncols=3,
+    fig_size=None,
+    dpi=100,
+    show_size=True,
+    percent=False,
+    note=" ",
+    file_format="png",
+    n_jobs=1,
+):
+    """
+    render many calculate_hte results without a display
+    (Agg canvases outside of pyplot, every figure is closed after saving,
+    so nothing accumulates in long running jobs)
+
+    Args:
+      results: dictionary {criterion: dataframe from calculate_hte}
+      save_path: the output file with layout="grid",
+        the output folder with layout="files"
+      layout: "grid" draws small multiples in one figure,
+        "files" writes one figure per criterion
+      ncols: columns of the grid
+      fig_size: figure size (per criterion with layout="files"),
+        by default 4.5 x 3.5 inches per panel
+      dpi, show_size, percent, note: see plot_hte
+      file_format: image format of the files with layout="files"
+      n_jobs: worker processes rendering the files with layout="files"
+        (-1 uses all cores)
+
+    Returns:
+      a list of the written paths
+    """
+    items = list(results.items())
+    options = {"dpi": dpi, "show_size": show_size, "percent": percent, "note": note}
+
+    if layout == "grid":
+        nrows = -(-len(items) // ncols)
+        if fig_size is None:
+            fig_size = (4.5 * ncols, 3.5 * nrows)
+        _render(items, save_path, fig_size, nrows, ncols, options)
+        return [save_path]
+    if layout != "files":
+        raise ValueError("layout must be 'grid' or 'files'")
+
+    os.makedirs(save_path, exist_ok=True)
+    if fig_size is None:
+        fig_size = (4.5, 3.5)
+    tasks = []
+    used = set()
+    for i, (criterion, df) in enumerate(items):
+        stem = re.sub(r"[^\w.-]+", "_", str(criterion))
+        # criteria that sanitize to the same name get the index of the item
+        while stem.lower() in used:
+            stem = "{}_{}".format(stem, i)
+        used.add(stem.lower())
+        file_name = stem + "." + file_format
+        tasks.append(([(criterion, df)], os.path.join(save_path, file_name)))
+
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    if n_jobs == 1:
+        for task in tasks:
+            _render(*task, fig_size, 1, 1, options)
     else:
-        ax.set_title(
-            "Treatment Effect on {} by Selected Subsets with Criterion ".format(
-                df["y"][0]
+        n = len(tasks)
+        with ProcessPoolExecutor(n_jobs) as pool:
+            list(
+                pool.map(
+                    _render,
+                    *zip(*tasks),
+                    [fig_size] * n,
+                    [1] * n,
+                    [1] * n,
+                    [options] * n,
+                    chunksize=max(1, n // (4 * n_jobs)),
+                )
             )
-            + criterion
-        )
+    return [path for _, path in tasks]
 
-    # add optional note for convenience
-    ax.text(0.5, -0.2, note, transform=ax.transAxes, ha="center")
 
-    # save the plot if needed
-    if save_path:
-        plt.savefig(save_path, bbox_inches="tight", dpi=dpi)
+def _render(items, path, fig_size, nrows, ncols, options):
+    # a Figure with an Agg canvas is not registered in pyplot,
+    # so it is freed as soon as it goes out of scope
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
 
-    # show the plot
-    plt.tight_layout()
-    plt.show()
+    fig = Figure(figsize=fig_size, dpi=options["dpi"])
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(nrows, ncols, squeeze=False).ravel()
+    for ax, (criterion, df) in zip(axes, items):
+        draw_hte(
+            ax,
+            df,
+            options["show_size"],
+            options["percent"],
+            str(criterion),
+            title=str(criterion),
+        )
+    for ax in axes[len(items) :]:
+        ax.set_axis_off()
+    # tight_layout already fits the labels, bbox_inches="tight" would draw again
+    rect = (0, 0, 1, 1)
+    if options["note"].strip():
+        fig.text(0.5, 0.01, options["note"], ha="center", va="bottom")
+        rect = (0, 0.05 / nrows, 1, 1)
+    fig.tight_layout(rect=rect)
+    fig.savefig(path)
+    fig.clear()
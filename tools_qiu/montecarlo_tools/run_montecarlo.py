@@ -0,0 +1,178 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from ..data_simulation_tools.simulate_chunks import SIMULATORS
+from ..te_tools.calculate_te import calculate_te
+from ..te_tools.sufficient_stats import estimate_groups
+
+
+def run_montecarlo(
+    simulator="rct",
+    t="treatment",
+    X_exo=None,
+    X_end=None,
+    y="y",
+    iv=False,
+    conf_level=0.95,
+    true_te=None,
+    n_reps=1000,
+    data_generation_parameters=None,
+    log_normal=True,
+    random_seed=10086,
+    n_jobs=1,
+    batch_size=50,
+    engine="numpy",
+):
+    """
+    coverage study of calculate_te:
+    simulate n_reps datasets, estimate the treatment effect on each
+    and compare the estimates with the true effect
+
+    replication r draws from the r-th SeedSequence(random_seed).spawn stream,
+    so the results do not depend on n_jobs or batch_size
+
+    Args:
+      simulator: "rct", "iv" or a function mapping a np.random.Generator to a df
+      t, X_exo, X_end, y, iv, conf_level: see calculate_te
+      true_te: the true effect of the fitted estimand, derived from the
+        coefficients for "rct" and "iv" (for "iv" the effect of X_end when
+        iv=True, otherwise the reduced-form effect of t on y)
+      n_reps: number of replications
+      data_generation_parameters: see simulate_rct / simulate_iv
+      log_normal: see simulate_rct / simulate_iv
+      random_seed: seed of the replication streams
+      n_jobs: number of worker processes (-1 for all cores)
+      batch_size: replications per task, with engine="numpy" the regressions
+        of a batch are solved together
+      engine: engine of calculate_te
+
+    Returns:
+      a list [summary_in_dictionary, dataframe_with_one_row_per_replication],
+      replications of a batch are estimated together, so timings are per
+      batch (batch_seconds) and the summary has the average per replication
+    """
+    X_exo = X_exo or []
+    if isinstance(simulator, str):
+        generate, default_parameters = SIMULATORS[simulator]
+        if data_generation_parameters is None:
+            data_generation_parameters = default_parameters
+        if true_te is None:
+            true_te = true_effect(simulator, data_generation_parameters, iv)
+    if true_te is None:
+        raise ValueError("true_te is needed for a custom simulator")
+
+    seeds = np.random.SeedSequence(random_seed).spawn(n_reps)
+    batches = [seeds[i : i + batch_size] for i in range(0, n_reps, batch_size)]
+    settings = {
+        "simulator": simulator,
+        "data_generation_parameters": data_generation_parameters,
+        "log_normal": log_normal,
+        "fit_kwargs": {
+            "t": t,
+            "X_exo": X_exo,
+            "X_end": X_end,
+            "y": y,
+            "iv": iv,
+            "conf_level": conf_level,
+        },
+        "engine": engine,
+    }
+
+    if n_jobs == 1:
+        results = [run_batch(batch, settings) for batch in batches]
+    else:
+        if n_jobs == -1:
+            n_jobs = os.cpu_count()
+        with ProcessPoolExecutor(n_jobs) as pool:
+            results = list(pool.map(run_batch, batches, [settings] * len(batches)))
+
+    reps_df = pd.DataFrame.from_records(
+        [{**row, "batch": b} for b, rows in enumerate(results) for row in rows]
+    )
+    reps_df.insert(0, "replication", np.arange(n_reps))
+    reps_df["error"] = reps_df["te"] - true_te
+    reps_df["covered"] = (reps_df["te_low"] <= true_te) & (
+        true_te <= reps_df["te_high"]
+    )
+
+    # each batch once, replications of a batch share its wall time
+    batch_seconds = reps_df.groupby("batch")["batch_seconds"].first()
+    summary_dict = {
+        "true_te": true_te,
+        "n_reps": n_reps,
+        "mean_te": reps_df["te"].mean(),
+        "bias": reps_df["error"].mean(),
+        "rmse": np.sqrt((reps_df["error"] ** 2).mean()),
+        "sd_te": reps_df["te"].std(),
+        "mean_std": reps_df["std"].mean(),
+        "coverage": reps_df["covered"].mean(),
+        "conf_level": conf_level,
+        "seconds_per_rep": batch_seconds.sum() / n_reps,
+    }
+
+    return [summary_dict, reps_df]
+
+
+def run_batch(seeds, settings):
+    """
+    simulate and estimate a batch of replications
+
+    Args:
+      seeds: SeedSequence of each replication
+      settings: see run_montecarlo
+
+    Returns:
+      a list of calculate_te dictionaries with the wall time of the batch
+    """
+    start = time.perf_counter()
+    dfs = [simulate_one(seed, settings) for seed in seeds]
+    fit_kwargs = settings["fit_kwargs"]
+
+    if settings["engine"] == "numpy":
+        # stack the replications and solve them as groups of one pass
+        sizes = [df.shape[0] for df in dfs]
+        codes = np.repeat(np.arange(len(dfs)), sizes)
+        results, _ = estimate_groups(
+            pd.concat(dfs, ignore_index=True),
+            codes=codes,
+            n_groups=len(dfs),
+            **fit_kwargs,
+        )
+    else:
+        results = [
+            calculate_te(df, engine=settings["engine"], **fit_kwargs) for df in dfs
+        ]
+
+    seconds = time.perf_counter() - start
+    return [{**result, "batch_seconds": seconds} for result in results]
+
+
+def true_effect(simulator, data_generation_parameters, iv):
+    """
+    true effect of the estimand fitted on a built-in simulator
+    """
+    coefficients = data_generation_parameters["coefficients"]
+    if simulator != "iv":
+        return coefficients[1]
+    iv_coefficients = data_generation_parameters["iv_coefficients"]
+    if iv:
+        # the effect of the endogenous x on y
+        return iv_coefficients[1]
+    # without an instrument, the fit is the reduced form of y on t,
+    # t moves x by coefficients[1] and x moves y by iv_coefficients[1]
+    return coefficients[1] * iv_coefficients[1]
+
+
+def simulate_one(seed, settings):
+    rng = np.random.default_rng(seed)
+    simulator = settings["simulator"]
+    if not isinstance(simulator, str):
+        return simulator(rng)
+    generate, _ = SIMULATORS[simulator]
+    parameters = settings["data_generation_parameters"]
+    return pd.DataFrame(
+        generate(parameters, rng, parameters["sample_size"], settings["log_normal"])
+    )
@@ -0,0 +1,211 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+# opt-in stage timings.
+# the tools wrap their steps in `with stage(name, rows=n):`,
+# which costs one global lookup when no profile is active.
+# stages run in worker processes are not recorded
+
+_active = []
+_local = threading.local()
+
+
+class Trace:
+    """
+    stages recorded by profile(), in the order they finished
+
+    every stage is a dictionary with name, parent, depth, start and seconds
+    (relative to the start of the profile), rows, thread, and with
+    trace_memory=True alloc_bytes (peak traced memory above the start of the stage)
+    """
+
+    def __init__(self, trace_memory=False, callback=None):
+        self.trace_memory = trace_memory
+        self.callback = callback
+        self.stages = []
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self.stages.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def summary(self):
+        """
+        total time, calls and rows per stage name
+
+        Returns:
+          a dataframe sorted by total seconds
+        """
+        df = pd.DataFrame.from_records(self.stages, columns=self._columns())
+        aggregations = {"seconds": "sum", "depth": "size", "rows": "sum"}
+        if self.trace_memory:
+            aggregations["alloc_bytes"] = "max"
+        result = df.groupby("name").agg(aggregations).rename(columns={"depth": "calls"})
+        return result.sort_values("seconds", ascending=False)
+
+    def to_json(self, path=None):
+        """
+        the stages as json (written to path when given)
+        """
+        text = json.dumps({"stages": self.stages}, indent=1, default=_to_builtin)
+        return _write(path, text)
+
+    def to_chrome_trace(self, path=None):
+        """
+        the stages in the Chrome trace event format,
+        open the file in chrome://tracing or https://ui.perfetto.dev
+        """
+        pid = os.getpid()
+        events = []
+        for record in self.stages:
+            args = {"rows": record["rows"], "parent": record["parent"]}
+            if "alloc_bytes" in record:
+                args["alloc_bytes"] = record["alloc_bytes"]
+            events.append(
+                {
+                    "name": record["name"],
+                    "ph": "X",
+                    "ts": record["start"] * 1e6,
+                    "dur": record["seconds"] * 1e6,
+                    "pid": pid,
+                    "tid": record["thread"],
+                    "args": args,
+                }
+            )
+        text = json.dumps({"traceEvents": events}, default=_to_builtin)
+        return _write(path, text)
+
+    def _columns(self):
+        columns = ["name", "parent", "depth", "start", "seconds", "rows", "thread"]
+        return columns + (["alloc_bytes"] if self.trace_memory else [])
+
+
+@contextmanager
+def profile(trace_memory=False, callback=None):
+    """
+    record the stages of the tools called inside the block
+
+    Args:
+      trace_memory: also record allocation sizes with tracemalloc
+        (slows down the tools considerably)
+      callback: optional function called with each finished stage
+
+    Example:
+      with profile() as trace:
+          calculate_hte(df, "x1", False, 10, "treatment", None, "x", "y", True)
+      trace.summary()
+      trace.to_chrome_trace("hte.json")
+    """
+    trace = Trace(trace_memory, callback)
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    _active.append(trace)
+    try:
+        yield trace
+    finally:
+        _active.remove(trace)
+        if started_tracing:
+            tracemalloc.stop()
+
+
+def stage(name, rows=None):
+    """
+    context manager timing one step of a tool (a no-op without profile())
+
+    Args:
+      name: name of the step
+      rows: number of rows processed
+    """
+    if not _active:
+        return _NULL_STAGE
+    return _stage(_active[-1], name, rows)
+
+
+@contextmanager
+def _stage(trace, name, rows):
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    parent = stack[-1] if stack else None
+    frame = {"name": name, "peak": 0}
+    if trace.trace_memory:
+        # the peak of the parent so far, then measure this stage alone
+        current, peak = tracemalloc.get_traced_memory()
+        if parent is not None:
+            parent["peak"] = max(parent["peak"], peak)
+        tracemalloc.reset_peak()
+        frame["base"] = current
+    stack.append(frame)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        stack.pop()
+        record = {
+            "name": name,
+            "parent": None if parent is None else parent["name"],
+            "depth": len(stack),
+            "start": start - trace.origin,
+            "seconds": seconds,
+            "rows": rows,
+            "thread": threading.get_ident(),
+        }
+        if trace.trace_memory:
+            peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+            record["alloc_bytes"] = peak - frame["base"]
+            if parent is not None:
+                parent["peak"] = max(parent["peak"], peak)
+        trace.add(record)
+
+
+def profiled(func):
+    """
+    decorator recording a whole call of a tool as a stage
+    (rows from the dataframe in the first argument)
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _active:
+            return func(*args, **kwargs)
+        df = args[0] if args else kwargs.get("df")
+        rows = df.shape[0] if hasattr(df, "shape") else None
+        with stage(func.__name__, rows=rows):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def _to_builtin(value):
+    # numpy scalars in rows
+    return value.item() if hasattr(value, "item") else str(value)
+
+
+def _write(path, text):
+    if path is not None:
+        with open(path, "w") as f:
+            f.write(text)
+    return text
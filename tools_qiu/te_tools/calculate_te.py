@@ -1,49 +1,113 @@
-from linearmodels.iv import IV2SLS
-import statsmodels.api as sm
+import pandas as pd
+from ..data_prep import as_pandas, regression_columns
+from ..profiling import profiled, stage
+from .sufficient_stats import calculate_te_numpy
 
 
-def calculate_te(df, t, X_exo, X_end, y, iv, conf_level):
+@profiled
+def calculate_te(
+    df,
+    t,
+    X_exo,
+    X_end,
+    y,
+    iv,
+    conf_level,
+    engine="linearmodels",
+    cache=None,
+    float32=False,
+):
     """
     calculate treatment effects
 
     Args:
-      df: data
+      df: data (a pandas DataFrame, an Arrow table or a Polars DataFrame)
       t: treatment variable (also the instrument variable)
       X_exo: exogenous covariate variables
       X_end: single endogenous variable
-      y: outcome variable
+      y: outcome variable, or a list of outcome variables
       iv: whether it is iv regression
       conf_level: confidence interval level
+      engine: "linearmodels" fits an IV2SLS model,
+        "numpy" solves from cross-product matrices (much faster, same results,
+        a list of outcomes shares one first stage and one solve)
+      cache: optional ResultCache, repeated calls on unchanged data
+        return the stored result
+      float32: with engine="numpy", read the covariates and outcomes as
+        float32 (the products lose precision, sums are kept in float64);
+        float32 columns are then read without a copy, float64 columns
+        are copied, so it only saves memory on float32 data
 
     Returns:
       a dictionary with estimates
+      (a dataframe with one row per outcome when y is a list)
     """
-    y_c, y_t = df.groupby(t)[y].mean().sort_index(ascending=True)
-    end_c, end_t = 0, 0
+    columns = regression_columns(t, X_exo, X_end, y, iv)
+    df = as_pandas(df, columns)
+    if cache is not None:
+        spec = ("calculate_te", t, X_exo, X_end, y, iv, conf_level, engine, float32)
+        return cache.get_or_compute(
+            df,
+            columns,
+            spec,
+            lambda: calculate_te(
+                df, t, X_exo, X_end, y, iv, conf_level, engine, float32=float32
+            ),
+        )
+    if engine == "numpy":
+        return calculate_te_numpy(df, t, X_exo, X_end, y, iv, conf_level, float32)
+    if engine != "linearmodels":
+        raise ValueError("engine must be 'linearmodels' or 'numpy'")
+    if float32:
+        raise ValueError("float32 needs engine='numpy'")
+    if isinstance(y, list):
+        # IV2SLS takes a single dependent variable
+        return pd.DataFrame.from_records(
+            [
+                calculate_te(df, t, X_exo, X_end, outcome, iv, conf_level)
+                for outcome in y
+            ]
+        )
+
+    # imported here, so the numpy engine works without loading them
+    from linearmodels.iv import IV2SLS
+    import statsmodels.api as sm
+
+    rows = df.shape[0]
+    with stage("group means", rows):
+        y_c, y_t = df.groupby(t)[y].mean().sort_index(ascending=True)
+        end_c, end_t = 0, 0
+        if iv:
+            end_c, end_t = df.groupby(t)[X_end].mean().sort_index(ascending=True)
     dependent = df[y]
     if iv:
-        end_c, end_t = df.groupby(t)[X_end].mean().sort_index(ascending=True)
-        if X_exo is None:
-            df["intercept"] = 1
-            exo = df["intercept"]
-        else:
-            exo = df[X_exo]
-            exo = sm.add_constant(exo)
-        end = df[X_end]
-        instruments = df[t]
-        model = IV2SLS(dependent, exo, end, instruments)
-        result = model.fit()
-        te = result.params[X_end]
-        te_low, te_high = result.conf_int(level=conf_level).loc[X_end]
-        std = result.std_errors[X_end]
+        with stage("model construction", rows):
+            if X_exo is None:
+                # a separate series, the caller's df is not modified
+                exo = pd.Series(1, index=df.index, name="intercept")
+            else:
+                exo = df[X_exo]
+                exo = sm.add_constant(exo)
+            end = df[X_end]
+            instruments = df[t]
+            model = IV2SLS(dependent, exo, end, instruments)
+        with stage("fit", rows):
+            result = model.fit()
+        with stage("result assembly"):
+            te = result.params[X_end]
+            te_low, te_high = result.conf_int(level=conf_level).loc[X_end]
+            std = result.std_errors[X_end]
     else:
-        exo = df[[t] + X_exo]
-        exo = sm.add_constant(exo)
-        model = IV2SLS(dependent, exo, None, None)
-        result = model.fit()
-        te = result.params[t]
-        te_low, te_high = result.conf_int(level=conf_level).loc[t]
-        std = result.std_errors[t]
+        with stage("model construction", rows):
+            exo = df[[t] + X_exo]
+            exo = sm.add_constant(exo)
+            model = IV2SLS(dependent, exo, None, None)
+        with stage("fit", rows):
+            result = model.fit()
+        with stage("result assembly"):
+            te = result.params[t]
+            te_low, te_high = result.conf_int(level=conf_level).loc[t]
+            std = result.std_errors[t]
 
     result_dict = {
         "data_size": df.shape[0],
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+from ..data_prep import regression_columns
+from .sufficient_stats import (
+    cross_products,
+    design_columns,
+    drop_incomplete,
+    report_all_rows,
+    residuals,
+    row_totals,
+    solve_cross_products,
+    te_results,
+)
+
+
+def calculate_te_chunked(
+    path, t, X_exo, X_end, y, iv, conf_level, chunk_size=1_000_000, file_format=None
+):
+    """
+    calculate treatment effects from a Parquet or CSV file
+    without loading it into memory:
+    the first pass accumulates the cross products,
+    the second pass the robust variance given the coefficients
+    (same outputs as calculate_te)
+
+    Args:
+      path: Parquet or CSV file
+      t, X_exo, X_end, y, iv, conf_level: see calculate_te
+      chunk_size: rows read at a time
+      file_format: "parquet" or "csv" (by default from the file extension)
+
+    Returns:
+      a dictionary with estimates
+    """
+    columns = regression_columns(t, X_exo, X_end, y, iv)
+
+    M = 0
+    totals = 0
+    for chunk in read_chunks(path, columns, chunk_size, file_format):
+        cols, iz, ix, target = design_columns(chunk, t, X_exo, X_end, y, iv)
+        totals = totals + row_totals(cols, iv)
+        # rows with a missing value are dropped, as linearmodels does
+        cols = drop_incomplete(cols)[0]
+        M = M + cross_products(cols)
+    if np.all(M == 0):
+        raise ValueError("{} has no complete rows".format(path))
+    beta, pi, xpx = solve_cross_products(M, iz, ix)
+
+    zeez = 0
+    for chunk in read_chunks(path, columns, chunk_size, file_format):
+        cols, iz, ix, target = design_columns(chunk, t, X_exo, X_end, y, iv)
+        cols = drop_incomplete(cols)[0]
+        e = residuals(cols, ix, beta)
+        zeez = zeez + cross_products([cols[i - 1] for i in iz[1:]], weights=e * e)
+
+    results = te_results(M, zeez, beta, pi, xpx, ix, target, y, X_end, iv, conf_level)
+    # data_size and the means count every row, as in linearmodels
+    return report_all_rows(results, totals, iv)[0]
+
+
+def read_chunks(path, columns, chunk_size, file_format=None):
+    """
+    read the columns of a Parquet or CSV file chunk by chunk
+
+    Args:
+      path: Parquet or CSV file
+      columns: the columns to read
+      chunk_size: rows per chunk
+      file_format: "parquet" or "csv" (by default from the file extension)
+
+    Returns:
+      an iterator of dataframes
+    """
+    if file_format is None:
+        file_format = "parquet" if str(path).endswith((".parquet", ".pq")) else "csv"
+    if file_format == "parquet":
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+    elif file_format == "csv":
+        yield from pd.read_csv(
+            path,
+            usecols=columns,
+            chunksize=chunk_size,
+            dtype={col: np.float64 for col in columns},
+        )
+    else:
+        raise ValueError("file_format must be 'parquet' or 'csv'")
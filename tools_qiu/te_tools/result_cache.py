@@ -0,0 +1,186 @@
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+class ResultCache:
+    """
+    opt-in memoization of calculate_te / calculate_hte results,
+    pass it as the cache argument
+
+    entries are keyed by a hash of the columns used and the call arguments,
+    so changing any value of those columns gives a new key.
+    the in-process tier keeps the most recently used results within
+    max_entries and max_bytes, the optional on-disk tier (one pickle
+    per entry) evicts the least recently used files once they exceed
+    max_disk_bytes
+
+    Args:
+      max_entries: number of results in the in-process tier
+      max_bytes: size limit of the in-process tier
+      directory: folder of the on-disk tier (None keeps results in memory only)
+      max_disk_bytes: size limit of the on-disk tier
+
+    Example:
+      cache = ResultCache(directory="~/.cache/tools_qiu")
+      calculate_hte(df, "x1", False, 5, "treatment", None, "x", "y", True, cache=cache)
+      cache.stats()
+    """
+
+    def __init__(
+        self, max_entries=128, directory=None, max_disk_bytes=2**30, max_bytes=2**28
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory = None if directory is None else os.path.expanduser(directory)
+        self.max_disk_bytes = max_disk_bytes
+        self.entries = OrderedDict()
+        # key -> approximate size of the in-process result
+        self.sizes = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def get_or_compute(self, df, columns, spec, compute):
+        """
+        cached result of compute() for the columns of df and the call spec
+
+        Args:
+          df: data
+          columns: the columns the result depends on
+          spec: hashable description of the call (function name and arguments)
+          compute: function without arguments producing the result
+
+        Returns:
+          the result (a copy, so callers can modify it)
+        """
+        key = hashlib.blake2b(
+            repr(spec).encode() + data_fingerprint(df, columns).encode(),
+            digest_size=16,
+        ).hexdigest()
+
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return _copy(self.entries[key])
+
+        result = self._load(key)
+        if result is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            result = compute()
+            self._save(key, result)
+
+        self.entries[key] = result
+        self.sizes[key] = _size(result)
+        total = sum(self.sizes.values())
+        while self.entries and (
+            len(self.entries) > self.max_entries or total > self.max_bytes
+        ):
+            old_key, _ = self.entries.popitem(last=False)
+            total -= self.sizes.pop(old_key)
+        return _copy(result)
+
+    def stats(self):
+        """
+        hit and miss counters and the number of cached entries
+        """
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "entries": len(self.entries),
+            "bytes": sum(self.sizes.values()),
+            "disk_bytes": sum(size for _, size, _ in self._disk_files()),
+        }
+
+    def clear(self):
+        """
+        drop all entries of both tiers
+        """
+        self.entries.clear()
+        self.sizes.clear()
+        for path, _, _ in self._disk_files():
+            os.remove(path)
+
+    def _load(self, key):
+        if self.directory is None:
+            return None
+        path = os.path.join(self.directory, key + ".pkl")
+        try:
+            with open(path, "rb") as f:
+                result = pickle.load(f)
+        except Exception:
+            # missing, partial or unreadable (e.g. written by another version),
+            # recomputed and overwritten like any miss
+            return None
+        # the access time drives the on-disk eviction
+        os.utime(path)
+        return result
+
+    def _save(self, key, result):
+        if self.directory is None:
+            return
+        path = os.path.join(self.directory, key + ".pkl")
+        # write then rename, so readers never see a partial file
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+        files = sorted(self._disk_files(), key=lambda file: file[2])
+        total = sum(size for _, size, _ in files)
+        for old_path, size, _ in files:
+            if total <= self.max_disk_bytes or old_path == path:
+                break
+            os.remove(old_path)
+            total -= size
+
+    def _disk_files(self):
+        if self.directory is None:
+            return []
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pkl"):
+                stat = entry.stat()
+                files.append((entry.path, stat.st_size, stat.st_mtime))
+        return files
+
+
+def data_fingerprint(df, columns):
+    """
+    content hash of some columns of a dataframe
+
+    numeric columns are hashed from their memory,
+    other columns through pd.util.hash_pandas_object
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(df.shape[0]).encode())
+    for name in columns:
+        col = df[name]
+        h.update("{}:{}".format(name, col.dtype).encode())
+        if isinstance(col.dtype, np.dtype) and col.dtype.kind in "biufcmM":
+            h.update(np.ascontiguousarray(col.to_numpy()).view(np.uint8))
+        else:
+            h.update(pd.util.hash_pandas_object(col, index=False).to_numpy())
+    return h.hexdigest()
+
+
+def _size(result):
+    # approximate memory of a cached result
+    if isinstance(result, pd.DataFrame):
+        return int(result.memory_usage(deep=True).sum())
+    return len(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def _copy(result):
+    if isinstance(result, pd.DataFrame):
+        return result.copy()
+    return dict(result)
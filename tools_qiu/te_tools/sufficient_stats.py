@@ -0,0 +1,533 @@
+import numpy as np
+import pandas as pd
+from ..data_prep import numeric_array, regression_columns, treatment_array
+from ..profiling import stage
+
+# numpy engine for calculate_te
+# OLS is 2SLS with the regressors as their own instruments,
+# so both are solved from the same cross-product matrices.
+# all functions work on a leading group axis,
+# so subsets can be estimated in a single pass over the data
+
+
+def design_columns(df, t, X_exo, X_end, y, iv, float32=False):
+    """
+    extract the columns used by the regression
+    (the column order follows linearmodels)
+
+    Args:
+      df: data
+      t: treatment variable (also the instrument variable)
+      X_exo: exogenous covariate variables
+      X_end: single endogenous variable
+      y: outcome variable, or a list of outcome variables
+      iv: whether it is iv regression
+      float32: read the covariates and outcomes as float32
+
+    Returns:
+      a list [cols, iz, ix, target]
+      cols: arrays for t (bool when it is 0/1), X_exo, X_end (if iv)
+        and the outcomes,
+      iz, ix: positions of the instruments and regressors in [intercept] + cols,
+      target: position of the treatment effect in the regressors
+    """
+    X_exo = [] if X_exo is None else list(X_exo)
+    names = regression_columns(t, X_exo, X_end, y, iv)
+    treatment = treatment_array(df[t])
+    if treatment.dtype != np.bool_:
+        # group means weigh the rows by t, so other codings would be wrong
+        values = treatment[~np.isnan(treatment)]
+        if np.count_nonzero((values == 0) | (values == 1)) != len(values):
+            raise ValueError(
+                "the numpy engine needs a 0/1 treatment, {} has other values".format(t)
+            )
+    cols = [treatment]
+    cols += [numeric_array(df[name], float32) for name in names[1:]]
+    exo = list(range(2, 2 + len(X_exo)))
+    if iv:
+        iz = [0] + exo + [1]
+        ix = [0] + exo + [2 + len(X_exo)]
+        target = len(ix) - 1
+    else:
+        iz = [0, 1] + exo
+        ix = iz
+        target = 1
+    return [cols, iz, ix, target]
+
+
+def drop_incomplete(cols, codes=None):
+    """
+    remove the rows with a missing value in any column,
+    as linearmodels does (no copy when nothing is missing)
+
+    Args:
+      cols: list of arrays
+      codes: group of each row, None for one group
+
+    Returns:
+      a list [cols, codes]
+    """
+    missing = None
+    for col in cols:
+        if col.dtype.kind == "f":
+            col_missing = np.isnan(col)
+            missing = col_missing if missing is None else missing | col_missing
+    if missing is None or not missing.any():
+        return [cols, codes]
+    keep = ~missing
+    return [[col[keep] for col in cols], None if codes is None else codes[keep]]
+
+
+def cross_products(cols, codes=None, n_groups=1, weights=None):
+    """
+    sums of products of [intercept] + cols within each group
+
+    Args:
+      cols: list of arrays
+      codes: group of each row (between 0 and n_groups - 1), None for one group
+      n_groups: number of groups
+      weights: optional row weights
+
+    Returns:
+      an array with shape (n_groups, len(cols) + 1, len(cols) + 1)
+    """
+    m = len(cols) + 1
+    result = np.empty((n_groups, m, m))
+
+    def group_sum(values):
+        if codes is None:
+            return np.sum(values) if values is not None else len(cols[0])
+        return np.bincount(codes, weights=values, minlength=n_groups)
+
+    result[:, 0, 0] = group_sum(weights)
+    for a in range(1, m):
+        col_a = cols[a - 1] if weights is None else cols[a - 1] * weights
+        result[:, 0, a] = group_sum(col_a)
+        result[:, a, 0] = result[:, 0, a]
+        for b in range(a, m):
+            result[:, a, b] = group_sum(col_a * cols[b - 1])
+            result[:, b, a] = result[:, a, b]
+    return result
+
+
+def outcome_products(cols, outcomes, codes=None, n_groups=1):
+    """
+    sums of products of [intercept] + cols with each outcome within each group
+
+    Args:
+      cols: list of arrays
+      outcomes: list of outcome arrays
+      codes: group of each row (between 0 and n_groups - 1), None for one group
+      n_groups: number of groups
+
+    Returns:
+      an array with shape (n_groups, len(cols) + 1, len(outcomes))
+    """
+    result = np.empty((n_groups, len(cols) + 1, len(outcomes)))
+    for j, col_y in enumerate(outcomes):
+        for a, col in enumerate([None] + cols):
+            values = col_y if col is None else col * col_y
+            if codes is None:
+                result[:, a, j] = np.sum(values)
+            else:
+                result[:, a, j] = np.bincount(codes, weights=values, minlength=n_groups)
+    return result
+
+
+def solve_2sls(zz, zx, zy):
+    """
+    solve 2SLS from cross-product matrices,
+    leading dimensions are treated as a batch
+    (groups with a singular design get nan)
+
+    Args:
+      zz: Z'Z with shape (..., q, q)
+      zx: Z'X with shape (..., q, p)
+      zy: Z'Y with shape (..., q, k)
+
+    Returns:
+      a list [beta, pi, xpx]
+      beta: coefficients with shape (..., p, k)
+      pi: first stage coefficients with shape (..., q, p)
+      xpx: X'P_zX with shape (..., p, p)
+    """
+    try:
+        pi = np.linalg.solve(zz, zx)
+        xpx = np.swapaxes(zx, -1, -2) @ pi
+        beta = np.linalg.solve(xpx, np.swapaxes(pi, -1, -2) @ zy)
+    except np.linalg.LinAlgError:
+        if zz.ndim == 2:
+            raise
+        solved = [solve_2sls_or_nan(zz[i], zx[i], zy[i]) for i in range(zz.shape[0])]
+        pi, xpx, beta = [np.stack(parts) for parts in zip(*solved)]
+    return [beta, pi, xpx]
+
+
+def solve_2sls_or_nan(zz, zx, zy):
+    try:
+        beta, pi, xpx = solve_2sls(zz, zx, zy)
+    except np.linalg.LinAlgError:
+        pi = np.full(zx.shape, np.nan)
+        xpx = np.full((zx.shape[1], zx.shape[1]), np.nan)
+        beta = np.full((zx.shape[1], zy.shape[1]), np.nan)
+    return [pi, xpx, beta]
+
+
+def residuals(cols, ix, beta, codes=None):
+    """
+    residuals of the outcome (the last column) given per group coefficients
+
+    Args:
+      cols: arrays from design_columns
+      ix: positions of the regressors in [intercept] + cols
+      beta: coefficients with shape (n_groups, p)
+      codes: group of each row, None for one group
+
+    Returns:
+      an array of residuals
+    """
+    if codes is None:
+        beta = beta[0]
+    else:
+        beta = beta[codes].T
+    e = cols[-1] - beta[0]
+    for j, i in enumerate(ix[1:], start=1):
+        e -= beta[j] * cols[i - 1]
+    return e
+
+
+def robust_std(pi, xpx, zeez, target):
+    """
+    heteroskedasticity robust standard error of one coefficient
+    (same as linearmodels cov_type="robust" with debiased=False)
+
+    Args:
+      pi: first stage coefficients with shape (..., q, p)
+      xpx: X'P_zX with shape (..., p, p)
+      zeez: Z' diag(e^2) Z with shape (..., q, q)
+      target: position of the coefficient
+
+    Returns:
+      standard errors with shape (...)
+    """
+    meat = np.swapaxes(pi, -1, -2) @ zeez @ pi
+    bread = np.full(xpx.shape, np.nan)
+    finite = np.isfinite(xpx).all(axis=(-1, -2))
+    bread[finite] = np.linalg.inv(xpx[finite])
+    cov = bread @ meat @ bread
+    return np.sqrt(cov[..., target, target])
+
+
+def conf_bounds(te, std, conf_level):
+    """
+    normal confidence interval, as in linearmodels with debiased=False
+    """
+    from scipy import stats
+
+    q = stats.norm.ppf(1 - (1 - conf_level) / 2)
+    return [te - q * std, te + q * std]
+
+
+def group_means(n, n_t, sum_all, sum_t):
+    """
+    control and treatment means from totals and treated totals
+    """
+    return [(sum_all - sum_t) / (n - n_t), sum_t / n_t]
+
+
+def row_totals(cols, iv, codes=None, n_groups=1):
+    """
+    the statistics linearmodels reports before dropping incomplete rows:
+    the rows of every group, and the count and sum of the non-missing values
+    of the outcome and of X_end in the control and treated rows
+
+    Args:
+      cols: arrays from design_columns with a single outcome (the last one)
+      iv: whether cols has X_end (before the outcome)
+      codes: group of each row (between 0 and n_groups - 1), None for one group
+      n_groups: number of groups
+
+    Returns:
+      an array with shape (n_groups, 9): the rows, then count_c, sum_c,
+      count_t and sum_t of the outcome and of X_end (zeros without iv)
+    """
+
+    def group_sum(values):
+        if codes is None:
+            return np.sum(values, dtype=np.float64)
+        return np.bincount(codes, weights=values, minlength=n_groups)
+
+    treatment = cols[0]
+    totals = np.zeros((n_groups, 9))
+    totals[:, 0] = group_sum(np.ones(len(treatment)))
+    targets = [cols[-1]] + ([cols[-2]] if iv else [])
+    for k, col in enumerate(targets):
+        present = ~np.isnan(col)
+        for a, arm in enumerate([treatment == 0, treatment == 1]):
+            mask = arm & present
+            totals[:, 1 + 4 * k + 2 * a] = group_sum(mask.astype(np.float64))
+            totals[:, 2 + 4 * k + 2 * a] = group_sum(np.where(mask, col, 0))
+    return totals
+
+
+def report_all_rows(results, totals, iv):
+    """
+    replace data_size and the group means of the results that dropped
+    incomplete rows by the values of linearmodels: every row,
+    and the means of the non-missing values of each column
+
+    Args:
+      results: calculate_te dictionaries
+      totals: row_totals of the same groups
+
+    Returns:
+      the results
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        y_c, y_t = totals[:, 2] / totals[:, 1], totals[:, 4] / totals[:, 3]
+        end_c, end_t = totals[:, 6] / totals[:, 5], totals[:, 8] / totals[:, 7]
+    for g, result in enumerate(results):
+        if result["data_size"] == totals[g, 0]:
+            # nothing was dropped, the regression statistics are the same
+            continue
+        result.update(data_size=int(totals[g, 0]), y_c=y_c[g], y_t=y_t[g])
+        if iv:
+            result.update(end_c=end_c[g], end_t=end_t[g])
+    return results
+
+
+def solve_cross_products(M, iz, ix):
+    """
+    2SLS coefficients of every group
+
+    Args:
+      M: cross products of [intercept] + cols (outcome last) per group
+      iz, ix: positions of the instruments and regressors
+
+    Returns:
+      a list [beta, pi, xpx], beta has shape (n_groups, p)
+    """
+    iy = M.shape[-1] - 1
+    zz = M[:, iz][:, :, iz]
+    zx = M[:, iz][:, :, ix]
+    zy = M[:, iz][:, :, [iy]]
+    beta, pi, xpx = solve_2sls(zz, zx, zy)
+    return [beta[..., 0], pi, xpx]
+
+
+def te_results(M, zeez, beta, pi, xpx, ix, target, y, X_end, iv, conf_level):
+    """
+    calculate_te dictionaries of every group from its statistics
+
+    Args:
+      M: cross products of [intercept] + cols (treatment first, outcome last)
+      zeez: Z' diag(e^2) Z per group
+      beta, pi, xpx: from solve_cross_products
+      ix, target: see design_columns
+      y, X_end, iv, conf_level: see calculate_te
+
+    Returns:
+      a list of dictionaries
+    """
+    iy = M.shape[-1] - 1
+    te = beta[:, target]
+    std = robust_std(pi, xpx, zeez, target)
+    te_low, te_high = conf_bounds(te, std, conf_level)
+    n = M[:, 0, 0]
+    # empty groups get nan means
+    with np.errstate(invalid="ignore", divide="ignore"):
+        y_c, y_t = group_means(n, M[:, 0, 1], M[:, 0, iy], M[:, 1, iy])
+        end_c, end_t = [0] * len(n), [0] * len(n)
+        if iv:
+            ie = ix[-1]
+            end_c, end_t = group_means(n, M[:, 0, 1], M[:, 0, ie], M[:, 1, ie])
+
+    return [
+        {
+            "data_size": int(n[g]),
+            "y": y,
+            "y_c": y_c[g],
+            "y_t": y_t[g],
+            "end": X_end,
+            "end_c": end_c[g],
+            "end_t": end_t[g],
+            "te": te[g],
+            "std": std[g],
+            "te_low": te_low[g],
+            "te_high": te_high[g],
+            "iv": iv,
+        }
+        for g in range(len(n))
+    ]
+
+
+def estimate_groups(
+    df, t, X_exo, X_end, y, iv, conf_level, codes=None, n_groups=1, float32=False
+):
+    """
+    calculate treatment effects for every group in one pass over the data,
+    the pooled estimate is solved from the summed group statistics.
+    with a list of outcomes, the first stage is solved once
+    and all outcomes are the columns of one right-hand side.
+    rows with a missing value in a used column are dropped, as in linearmodels;
+    with a list of outcomes every outcome keeps its own complete rows
+    (outcomes missing on the same rows share one solve).
+    like linearmodels, data_size counts every row and the group means
+    skip only the missing values of their own column
+
+    Args:
+      see calculate_te
+      codes: group of each row (between 0 and n_groups - 1), None for one group
+      n_groups: number of groups
+      float32: read the covariates and outcomes as float32
+        (the products lose precision, sums are kept in float64)
+
+    Returns:
+      a list [group_results, pooled_result] of calculate_te dictionaries
+      (lists of dictionaries, one per outcome, when y is a list)
+    """
+    outcomes = y if isinstance(y, list) else [y]
+    rows = df.shape[0]
+    with stage("design columns", rows):
+        cols, iz, ix, target = design_columns(df, t, X_exo, X_end, y, iv, float32)
+        cols, ycols = cols[: -len(outcomes)], cols[-len(outcomes) :]
+
+    results = [None] * len(outcomes)
+    for members in missing_patterns(ycols):
+        pattern_results = estimate_outcomes(
+            cols,
+            [ycols[j] for j in members],
+            [outcomes[j] for j in members],
+            iz,
+            ix,
+            target,
+            X_end,
+            iv,
+            conf_level,
+            codes,
+            n_groups,
+        )
+        for j, result in zip(members, pattern_results):
+            results[j] = result
+
+    # data_size and the means count every row, as in linearmodels
+    if any(result[-1]["data_size"] < rows for result in results):
+        for col_y, result in zip(ycols, results):
+            totals = row_totals(cols + [col_y], iv, codes, n_groups)
+            if codes is not None:
+                totals = np.concatenate([totals, totals.sum(axis=0, keepdims=True)])
+            report_all_rows(result, totals, iv)
+
+    if not isinstance(y, list):
+        return [results[0][:n_groups], results[0][-1]]
+    # per group, one dictionary per outcome
+    group_results = [[result[g] for result in results] for g in range(n_groups)]
+    return [group_results, [result[-1] for result in results]]
+
+
+def missing_patterns(ycols):
+    """
+    outcomes grouped by their missing rows
+
+    Returns:
+      a list of lists of outcome positions
+    """
+    patterns = []
+    for j, col in enumerate(ycols):
+        missing = np.isnan(col) if col.dtype.kind == "f" else None
+        if missing is not None and not missing.any():
+            missing = None
+        for pattern in patterns:
+            if (pattern[0] is None and missing is None) or (
+                pattern[0] is not None
+                and missing is not None
+                and np.array_equal(pattern[0], missing)
+            ):
+                pattern[1].append(j)
+                break
+        else:
+            patterns.append([missing, [j]])
+    return [members for _, members in patterns]
+
+
+def estimate_outcomes(
+    cols, ycols, outcomes, iz, ix, target, X_end, iv, conf_level, codes, n_groups
+):
+    """
+    estimate_groups for outcomes sharing their complete rows
+
+    Returns:
+      one list of calculate_te dictionaries per outcome
+      (every group, then the pooled row when there are codes)
+    """
+    rows = len(cols[0])
+    # incomplete rows are left out of every group and of the pooled row
+    cols, codes = drop_incomplete(cols + ycols, codes)
+    cols, ycols = cols[: -len(outcomes)], cols[-len(outcomes) :]
+
+    with stage("cross products", rows):
+        M = cross_products(cols, codes, n_groups)
+        MY = outcome_products(cols, ycols, codes, n_groups)
+        if codes is not None:
+            M = np.concatenate([M, M.sum(axis=0, keepdims=True)])
+            MY = np.concatenate([MY, MY.sum(axis=0, keepdims=True)])
+    with stage("solve"):
+        zz = M[:, iz][:, :, iz]
+        zx = M[:, iz][:, :, ix]
+        beta, pi, xpx = solve_2sls(zz, zx, MY[:, iz])
+
+    # the statistics of one outcome, with the outcome as the last column
+    m = M.shape[-1]
+    M_y = np.empty((M.shape[0], m + 1, m + 1))
+    M_y[:, :m, :m] = M
+    M_y[:, m, m] = np.nan
+
+    zcols = [cols[i - 1] for i in iz[1:]]
+    results = []
+    for j, outcome in enumerate(outcomes):
+        M_y[:, :m, m] = MY[:, :, j]
+        M_y[:, m, :m] = MY[:, :, j]
+        y_cols = cols + [ycols[j]]
+        with stage("robust variance", rows):
+            e = residuals(y_cols, ix, beta[-1:, :, j])
+            zeez = cross_products(zcols, weights=e * e)
+            if codes is not None:
+                e = residuals(y_cols, ix, beta[:-1, :, j], codes)
+                zeez = np.concatenate(
+                    [cross_products(zcols, codes, n_groups, e * e), zeez]
+                )
+        with stage("result assembly"):
+            results.append(
+                te_results(
+                    M_y,
+                    zeez,
+                    beta[:, :, j],
+                    pi,
+                    xpx,
+                    ix,
+                    target,
+                    outcome,
+                    X_end,
+                    iv,
+                    conf_level,
+                )
+            )
+    return results
+
+
+def calculate_te_numpy(df, t, X_exo, X_end, y, iv, conf_level, float32=False):
+    """
+    calculate treatment effects from cross-product matrices
+    (same outputs as calculate_te with engine="linearmodels")
+
+    Args:
+      see calculate_te
+
+    Returns:
+      a dictionary with estimates
+      (a dataframe with one row per outcome when y is a list)
+    """
+    result = estimate_groups(df, t, X_exo, X_end, y, iv, conf_level, float32=float32)[1]
+    if isinstance(y, list):
+        return pd.DataFrame.from_records(result)
+    return result
@@ -0,0 +1,243 @@
+import numpy as np
+import pandas as pd
+from ..data_prep import regression_columns
+from .sufficient_stats import (
+    design_columns,
+    drop_incomplete,
+    report_all_rows,
+    row_totals,
+    solve_cross_products,
+    te_results,
+)
+
+# one pass, mergeable statistics behind calculate_te.
+# the robust variance needs sum(e^2 z z') with e = y - X b unknown until the end,
+# so the accumulator keeps the fourth moments sum(u_a u_b u_c u_d)
+# of u = [intercept, t, X_exo, X_end, y]; everything else is a slice of them.
+# columns are shifted by the means of the first chunk for numerical accuracy,
+# u - shift is a linear map of u (the intercept is 1), so moments with
+# different shifts are merged by transforming one of them
+
+
+class TEAccumulator:
+    """
+    incremental calculate_te (and calculate_hte for a categorical criterion)
+
+    the state of each by value is m^4 floats with m = 3 + len(X_exo)
+    (+ 1 with iv): about 2MB for 20 covariates and 70MB for 50, so keep the
+    covariates to a few dozen
+
+    Args:
+      t, X_exo, X_end, iv: see calculate_te
+      y: a single outcome variable
+      by: optional categorical column, statistics are kept per value;
+        rows with a missing value only count in "all", as in calculate_hte
+
+    Example:
+      acc = TEAccumulator("treatment", ["x1"], "x", "y", iv=True)
+      for chunk in chunks:
+          acc.update(chunk)
+      acc.merge(other_acc).result(conf_level=0.95)
+    """
+
+    def __init__(self, t, X_exo, X_end, y, iv, by=None):
+        if isinstance(y, list):
+            raise ValueError("TEAccumulator takes a single outcome, not a list")
+        self.spec = {"t": t, "X_exo": X_exo, "X_end": X_end, "y": y, "iv": iv}
+        self.by = by
+        self.shift = None
+        # value of the by column -> fourth moments, None holds the rows
+        # without a by value (all rows when there is no by column)
+        self.moments = {}
+        # value of the by column -> row_totals of all its rows, complete or not
+        self.totals = {}
+
+    def update(self, chunk):
+        """
+        add the rows of a dataframe
+
+        Returns:
+          self
+        """
+        cols = design_columns(chunk, **self.spec)[0]
+        codes, values = None, []
+        if self.by is not None:
+            codes, values = pd.factorize(chunk[self.by])
+        # every row counts in data_size and the means, as in linearmodels
+        if codes is None:
+            self._add(self.totals, None, row_totals(cols, self.spec["iv"])[0])
+        else:
+            totals = row_totals(cols, self.spec["iv"], codes + 1, len(values) + 1)
+            for value, value_totals in zip([None] + list(values), totals):
+                if value_totals[0] > 0:
+                    self._add(self.totals, value, value_totals)
+        # rows with a missing value are dropped from the regression
+        cols, codes = drop_incomplete(cols, codes)
+        if len(cols[0]) == 0:
+            # nothing to add, and no rows to take the shift from
+            return self
+        u = np.column_stack([np.ones(len(cols[0]))] + cols)
+        if self.shift is None:
+            self.shift = u.mean(axis=0)
+            self.shift[0] = 0
+        u -= self.shift
+
+        if self.by is None:
+            self._add(self.moments, None, fourth_moments(u))
+        else:
+            # factorize codes the missing by values as -1, they sort first
+            order = np.argsort(codes, kind="stable")
+            counts = np.bincount(codes + 1, minlength=len(values) + 1)
+            rows = np.split(order, np.cumsum(counts)[:-1])
+            for value, group_rows in zip([None] + list(values), rows):
+                if len(group_rows) > 0:
+                    self._add(self.moments, value, fourth_moments(u[group_rows]))
+        return self
+
+    def merge(self, other):
+        """
+        add the statistics of another accumulator with the same spec
+
+        Returns:
+          self
+        """
+        if other.spec != self.spec or other.by != self.by:
+            raise ValueError("accumulators with different specs cannot be merged")
+        for key, totals in other.totals.items():
+            self._add(self.totals, key, totals)
+        if other.shift is None:
+            return self
+        if self.shift is None:
+            self.shift = other.shift.copy()
+        # moments of u - other.shift to moments of u - self.shift
+        A = np.eye(len(self.shift))
+        A[:, 0] += other.shift - self.shift
+        for key, T in other.moments.items():
+            T = np.einsum("ia,jb,kc,ld,abcd->ijkl", A, A, A, A, T)
+            self._add(self.moments, key, T)
+        return self
+
+    def result(self, conf_level=0.95):
+        """
+        estimates from all rows added so far
+
+        Returns:
+          a dictionary with the calculate_te keys
+        """
+        self._check_rows()
+        return self._results(
+            [sum(self.moments.values())], [sum(self.totals.values())], conf_level
+        )[0]
+
+    def hte_result(self, conf_level=0.95):
+        """
+        estimates per value of the by column, plus "all"
+
+        Returns:
+          a dataframe like calculate_hte with a categorical criterion
+        """
+        self._check_rows()
+        names = [key for key in self.moments if key is not None]
+        moments = [self.moments[name] for name in names]
+        totals = [self.totals[name] for name in names]
+        names.append("all")
+        moments.append(sum(self.moments.values()))
+        totals.append(sum(self.totals.values()))
+        results = self._results(moments, totals, conf_level)
+        return pd.DataFrame.from_records(
+            [{**result, "subset_name": name} for result, name in zip(results, names)]
+        )
+
+    def to_dict(self):
+        """
+        plain python representation (json serializable for json friendly by values)
+        """
+        return {
+            "spec": self.spec,
+            "by": self.by,
+            "shift": None if self.shift is None else self.shift.tolist(),
+            "moments": [[key, T.tolist()] for key, T in self.moments.items()],
+            "totals": [[key, S.tolist()] for key, S in self.totals.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        acc = cls(by=state["by"], **state["spec"])
+        if state["shift"] is not None:
+            acc.shift = np.array(state["shift"])
+        acc.moments = {key: np.array(T) for key, T in state["moments"]}
+        acc.totals = {key: np.array(S) for key, S in state["totals"]}
+        return acc
+
+    def _check_rows(self):
+        if not self.moments:
+            raise ValueError("no complete rows have been added")
+
+    @staticmethod
+    def _add(stats, key, value):
+        stats[key] = stats[key] + value if key in stats else value
+
+    def _results(self, moments, totals, conf_level):
+        _, iz, ix, target = design_columns(_empty_frame(self.spec), **self.spec)
+        T = np.stack(moments)
+        # second moments are T[..., 0, 0] because the intercept is 1
+        M = T[:, :, :, 0, 0]
+        beta, pi, xpx = solve_cross_products(M, iz, ix)
+
+        # e = coef @ u with coef = (-beta on the regressors, 1 on y)
+        iy = M.shape[-1] - 1
+        ie = ix + [iy]
+        coef = np.concatenate([-beta, np.ones((len(beta), 1))], axis=1)
+        T_ze = T[:, iz][:, :, iz][:, :, :, ie][:, :, :, :, ie]
+        zeez = np.einsum("gabcd,gc,gd->gab", T_ze, coef, coef)
+
+        # means need the unshifted second moments
+        B = np.eye(len(self.shift))
+        B[:, 0] += self.shift
+        M_raw = B @ M @ B.T
+        results = te_results(
+            M_raw,
+            zeez,
+            beta,
+            pi,
+            xpx,
+            ix,
+            target,
+            self.spec["y"],
+            self.spec["X_end"],
+            self.spec["iv"],
+            conf_level,
+        )
+        return report_all_rows(results, np.stack(totals), self.spec["iv"])
+
+
+def fourth_moments(u, max_elements=2**24):
+    """
+    sum over rows of u_a u_b u_c u_d
+
+    Args:
+      u: array with shape (n, m)
+      max_elements: size limit of the pairwise products of one slice of rows
+
+    Returns:
+      an array with shape (m, m, m, m)
+    """
+    m = u.shape[1]
+    a, b = np.triu_indices(m)
+    pair = np.empty((m, m), dtype=int)
+    pair[a, b] = np.arange(len(a))
+    pair[b, a] = pair[a, b]
+
+    G = np.zeros((len(a), len(a)))
+    step = max(1, max_elements // len(a))
+    for start in range(0, u.shape[0], step):
+        rows = u[start : start + step]
+        P = rows[:, a] * rows[:, b]
+        G += P.T @ P
+    index = pair.ravel()
+    return G[np.ix_(index, index)].reshape(m, m, m, m)
+
+
+def _empty_frame(spec):
+    # design_columns on no rows gives the column positions
+    return pd.DataFrame({name: [] for name in regression_columns(**spec)})